@@ -1,9 +1,10 @@
 import logging
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from sword.sword import sword as _sword
+from sword.sword import sword as _sword, add_keywords, remove_keywords, keyword_count
 from bs4 import BeautifulSoup
 from shield.shield import Shield
+from shield.scheduler import BatchScheduler
 from spider.spider import spider  # Added import for spider
 
 logging.basicConfig(
@@ -11,19 +12,29 @@ logging.basicConfig(
 )
 
 shield_model = Shield()
+# 并发的 Shield 请求由后台线程合并成批推理
+shield_scheduler = BatchScheduler(shield_model)
 
 # 创建Flask应用实例
 app = Flask(__name__)
 CORS(app)  # 为所有路由启用CORS
 
 
+def _strings(value) -> bool:
+    # 关键字和列表名必须是字符串，其他类型会在 sword 内部出错
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
 # 定义sword端点
 @app.route("/sword", methods=["POST"])
 def handle_sword():
     data = request.get_json()
     text = data.get("text", "")
+    lists = data.get("lists")  # 只检测这些关键字列表，不提供时检测全部
     if not text:
         return jsonify({"error": "没有提供文本"}), 400
+    if lists is not None and not _strings(lists):
+        return jsonify({"error": "lists 必须是列表名的列表"}), 400
     try:
         # 如果提供的是HTML，则从body中提取文本
         soup = BeautifulSoup(text, "html.parser")
@@ -33,7 +44,7 @@ def handle_sword():
         else:
             body_text = soup.get_text() if soup.get_text() else text
 
-        keywords = _sword(body_text)
+        keywords = _sword(body_text, lists)
         return jsonify({"keywords": keywords})
     except AttributeError as ae:
         logging.error(
@@ -41,7 +52,7 @@ def handle_sword():
         )
         # 如果特定的解析失败，则回退到分析原始文本
         try:
-            keywords = _sword(text)
+            keywords = _sword(text, lists)
             return jsonify(
                 {
                     "keywords": keywords,
@@ -55,7 +66,7 @@ def handle_sword():
         logging.error(f"在 /sword 时发生意外错误: {e}")
         # 通用回退或特定的错误处理
         try:
-            keywords = _sword(text)  # 如果解析意外失败，则尝试使用原始文本
+            keywords = _sword(text, lists)  # 如果解析意外失败，则尝试使用原始文本
             return jsonify(
                 {
                     "keywords": keywords,
@@ -70,6 +81,37 @@ def handle_sword():
             )
 
 
+# 运行中增删关键字，无需重启服务
+@app.route("/sword/keywords", methods=["POST"])
+def handle_sword_keywords():
+    data = request.get_json()
+    add = data.get("add", [])
+    remove = data.get("remove", [])
+    list_name = data.get("list")  # 不提供时加入默认列表、从所有列表中删除
+    if not _strings(add) or not _strings(remove):
+        return jsonify({"error": "add 和 remove 必须是关键字（字符串）列表"}), 400
+    if list_name is not None and not isinstance(list_name, str):
+        return jsonify({"error": "list 必须是列表名（字符串）"}), 400
+    try:
+        if list_name is None:
+            added = add_keywords(add)
+        else:
+            added = add_keywords(add, list_name)
+        removed = remove_keywords(remove, list_name)
+        return jsonify(
+            {
+                "added": added,
+                "removed": removed,
+                "total": keyword_count(list_name),
+            }
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"在 /sword/keywords 时出错: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 # 定义shield端点
 @app.route("/shield", methods=["POST"])
 def handle_shield():
@@ -78,7 +120,7 @@ def handle_shield():
     if not html_content:
         return jsonify({"error": "没有提供HTML内容"}), 400
     try:
-        result_label = shield_model(html_content)
+        result_label = shield_scheduler(html_content)
         return jsonify({"result": result_label})
     except Exception as e:
         logging.error(f"在 /shield 时出错: {e}")  # 使用日志记录错误
@@ -97,7 +139,7 @@ def detect_html_content_route():
     try:
         result = {}
         result["sword"] = _sword(html_content)  # 敏感词检测
-        result["shield"] = shield_model(html_content)  # 恶意网页检测
+        result["shield"] = shield_scheduler(html_content)  # 恶意网页检测
         return jsonify(result)
     except Exception as e:
         logging.error(f"Error at /detect_html_content: {e}")
@@ -114,14 +156,21 @@ def detect_urls_route():
         # Assuming spider returns a dict: {url: html_content_or_error_string}
         # And that html_content_or_error_string is None or empty if fetching failed for a URL
         crawled_responses = spider(url_list)
+        pages = {
+            url: html_content
+            for url, html_content in crawled_responses.items()
+            if html_content and isinstance(html_content, str)
+        }
+        # 所有成功获取的网页一起分批检测
+        shield_results = dict(
+            zip(pages, shield_scheduler.predict_batch(list(pages.values())))
+        )
         results = {}
         for url, html_content in crawled_responses.items():
-            if html_content and isinstance(
-                html_content, str
-            ):  # Check if content was successfully fetched
+            if url in pages:  # Check if content was successfully fetched
                 results[url] = {
                     "sword": _sword(html_content),
-                    "shield": shield_model(html_content),
+                    "shield": shield_results[url]["label"],
                 }
             else:
                 results[url] = {
@@ -135,11 +184,25 @@ def detect_urls_route():
         return jsonify({"error": str(e)}), 500
 
 
+# Shield 批量推理的队列深度、批大小、判定缓存和近似重复复用统计
+@app.route("/shield/stats", methods=["GET"])
+def shield_stats_route():
+    return jsonify({**shield_scheduler.stats(), **shield_model.stats()})
+
+
+# 模型加载状态，Shield 未加载完成时返回 503，可用作就绪检查
 @app.route("/model_status", methods=["GET"])
 def get_model_status_route():
     try:
-        # Basic status, can be expanded later if models have load states
-        return jsonify({"sword_model": "加载完成", "shield_model": "加载完成"})
+        status = shield_model.status()
+        shield_state = {"ready": "加载完成", "loading": "加载中", "failed": "加载失败"}
+        return jsonify(
+            {
+                "sword_model": "加载完成",
+                "shield_model": shield_state[status["state"]],
+                "shield": status,
+            }
+        ), (200 if status["state"] == "ready" else 503)
     except Exception as e:
         logging.error(f"Error at /model_status: {e}")
         return jsonify({"error": str(e)}), 500
@@ -2,12 +2,20 @@ import logging
 import os
 from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
-from bs4 import BeautifulSoup
 
 # Project-specific imports
 from spider.spider import spider
-from sword.sword import sword as _sword
+from sword.sword import (
+    sword as _sword,
+    sword_many,
+    start_pool,
+    add_keywords,
+    remove_keywords,
+    keyword_count,
+)
 from shield.shield import Shield
+from shield.scheduler import BatchScheduler
+from shield.tags import extract_tags
 from toTable import write2table, EXPORT_DIR  # Import EXPORT_DIR
 
 # Configure logging
@@ -18,7 +26,11 @@ logging.basicConfig(
 # Initialize Flask app and Shield model
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+# Fork the keyword scanning workers once, before Shield and the scheduler start threads
+start_pool()
 shield_model = Shield()
+# Concurrent Shield requests are grouped into batches by one background thread
+shield_scheduler = BatchScheduler(shield_model)
 
 # Ensure the export directory exists
 if not os.path.exists(EXPORT_DIR):
@@ -29,11 +41,13 @@ def extract_html_tags(html_content: str) -> list[str]:
     """Extracts unique HTML tag names from HTML content."""
     if not html_content:
         return []
-    soup = BeautifulSoup(html_content, "html.parser")
-    tags = set()
-    for tag_element in soup.find_all(True):  # True matches all tags
-        tags.add(tag_element.name)
-    return sorted(list(tags))
+    # Same tag names as BeautifulSoup's find_all(True), without building a tree
+    return sorted(set(extract_tags(html_content, limit=None)))
+
+
+def _strings(value) -> bool:
+    """True if value is a list of strings, as keywords and list names must be."""
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
 
 
 @app.route("/api/analyze_url", methods=["POST"])
@@ -62,7 +76,7 @@ def analyze_url_route():
                 200,
             )  # Return 200 as the operation to analyze was attempted
 
-        shield_result = shield_model(html_content)
+        shield_result = shield_scheduler(html_content)
         sword_result = _sword(html_content)
         html_tags = extract_html_tags(html_content)
 
@@ -94,6 +108,28 @@ def analyze_urls_route():
 
     spider_results = spider(urls)  # Batch crawl
 
+    # Keyword scanning for the whole batch runs across a process pool
+    pages = {
+        url: html_content
+        for url, html_content in spider_results.items()
+        if html_content and not html_content.startswith("错误:")
+    }
+    # If a batch call fails, the pages are retried one by one below so that
+    # only the pages that actually fail are reported as errors
+    try:
+        sword_results = dict(zip(pages, sword_many(pages.values())))
+    except Exception as e:
+        logging.error(f"Batch keyword scan failed, falling back to single pages: {e}")
+        sword_results = {}
+    # Shield classifies the batch with dynamic padding instead of one page at a time
+    try:
+        shield_results = dict(
+            zip(pages, shield_scheduler.predict_batch(list(pages.values())))
+        )
+    except Exception as e:
+        logging.error(f"Batch classification failed, falling back to single pages: {e}")
+        shield_results = {}
+
     for url in urls:
         html_content = spider_results.get(url)
 
@@ -110,14 +146,20 @@ def analyze_urls_route():
             continue
 
         try:
-            shield_result = shield_model(html_content)
-            sword_result = _sword(html_content)
+            shield_verdict = shield_results.get(url)
+            if shield_verdict is None:
+                shield_verdict = shield_scheduler.predict_batch([html_content])[0]
+            shield_result = shield_verdict["label"]
+            sword_result = sword_results.get(url)
+            if sword_result is None:
+                sword_result = _sword(html_content)
             # html_tags = extract_html_tags(html_content) # Not in spec for batch results items
 
             results.append(
                 {
                     "url": url,
                     "shield_result": shield_result,
+                    "shield_probability": shield_verdict["probability"],
                     "sword_result": sword_result,
                     "status": "Success",
                 }
@@ -152,7 +194,7 @@ def analyze_html_route():
         return jsonify({"error": "HTML content is required"}), 400
 
     try:
-        shield_result = shield_model(html_content)
+        shield_result = shield_scheduler(html_content)
         sword_result = _sword(html_content)
         html_tags = extract_html_tags(html_content)
 
@@ -168,6 +210,38 @@ def analyze_html_route():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/keywords", methods=["POST"])
+def update_keywords_route():
+    """Adds or removes sword keywords in the running process."""
+    data = request.get_json()
+    add = data.get("add", [])
+    remove = data.get("remove", [])
+    list_name = data.get("list")  # Default list for additions, all lists for removals
+
+    if not _strings(add) or not _strings(remove):
+        return (
+            jsonify({"error": "'add' and 'remove' must be lists of keyword strings"}),
+            400,
+        )
+    if list_name is not None and not isinstance(list_name, str):
+        return jsonify({"error": "'list' must be a list name string"}), 400
+
+    try:
+        if list_name is None:
+            added = add_keywords(add)
+        else:
+            added = add_keywords(add, list_name)
+        removed = remove_keywords(remove, list_name)
+        return jsonify(
+            {"added": added, "removed": removed, "total": keyword_count(list_name)}
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error in /api/keywords: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/export_excel", methods=["POST"])
 def export_excel_route():
     data = request.get_json()
@@ -199,6 +273,19 @@ def export_excel_route():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/shield_stats", methods=["GET"])
+def shield_stats_route():
+    """Returns Shield micro-batching queue depth, batch-size, verdict cache and near-duplicate reuse stats."""
+    return jsonify({**shield_scheduler.stats(), **shield_model.stats()})
+
+
+@app.route("/api/model_status", methods=["GET"])
+def model_status_route():
+    """Returns Shield load state; 503 until the model is ready."""
+    status = shield_model.status()
+    return jsonify(status), (200 if status["state"] == "ready" else 503)
+
+
 @app.route("/exports/<path:filename>", methods=["GET"])
 def download_exported_file(filename):
     try:
@@ -0,0 +1,275 @@
+"""Shield 网页分类的性能基准
+
+在项目根目录运行：
+
+    python -m benchmark.shield_bench --html-dir path/to/pages --output shield_bench.json
+
+对每个可用的模型变体（FP32、INT8 量化、ONNX，以及对应的蒸馏学生模型）、线程数和
+批大小，把网页按批送入 Shield，分别计时预处理（标签序列提取、WordPiece 分词）和
+前向计算，记录每个网页的延迟 p50/p95/p99、每秒网页数和内存，结果写入 JSON 文件；
+判定缓存、近似重复复用和级联都不参与，每个网页都经过模型。每个变体在单独的进程中
+运行，峰值 RSS 和加载模型增加的 RSS 只属于该变体。--baseline 指定上一次的结果文件
+时打印吞吐量变化
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import numpy as np
+from shield.backend import OnnxBackend, TorchBackend
+from shield.shield import Shield
+
+HTML_FILES = "test_server/templates/*.html"
+# 变体名 -> Shield 的参数
+VARIANTS = {
+    "torch": {"backend": "torch"},
+    "int8": {"backend": "torch", "quantize": True},
+    "onnx": {"backend": "onnx"},
+    "student": {"backend": "torch", "student": True},
+    "student-int8": {"backend": "torch", "student": True, "quantize": True},
+    "student-onnx": {"backend": "onnx", "student": True},
+}
+
+
+def _pages(html_dir: str, docs: int) -> list:
+    pattern = os.path.join(html_dir, "**", "*.htm*") if html_dir else HTML_FILES
+    pages = []
+    for filename in sorted(glob.glob(pattern, recursive=True)):
+        with open(filename, encoding="utf-8", errors="ignore") as f:
+            html = f.read()
+        if html:
+            pages.append(html)
+    if not pages:
+        raise SystemExit(f"没有找到 HTML 文件: {pattern}")
+    if docs:
+        # 页面不够时循环使用，超过时只取前 docs 个
+        pages = [pages[i % len(pages)] for i in range(docs)]
+    return pages
+
+
+def _percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else None
+
+
+def _max_rss() -> int:
+    # ru_maxrss 在 Linux 上以 KB 为单位，是进程启动以来的峰值
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load(variant: str) -> Shield:
+    # 逐个网页都交给模型，不用级联和推理进程
+    options = {"student": False, "quantize": False, **VARIANTS[variant]}
+    return Shield(warmup="eager", workers=0, cascade=False, **options)
+
+
+def _padded(input_ids: list, pad: int) -> tuple:
+    # 与 Shield._classify 相同：按长度排序，只补齐到批内最长的序列
+    input_ids = sorted(input_ids, key=len)
+    width = max(len(ids) for ids in input_ids)
+    ids = np.full((len(input_ids), width), pad, np.int64)
+    masks = np.zeros((len(input_ids), width), np.int64)
+    for row, encoded in enumerate(input_ids):
+        ids[row, : len(encoded)] = encoded
+        masks[row, : len(encoded)] = 1
+    return ids, masks
+
+
+def _run_batches(shield: Shield, backend, pages: list, batch_size: int) -> dict:
+    """把 pages 按 batch_size 分批检测一遍；同一批的网页一起返回，延迟为整批的耗时"""
+    latencies = []
+    tags_seconds = tokenize_seconds = forward_seconds = 0.0
+    for start in range(0, len(pages), batch_size):
+        batch = pages[start : start + batch_size]
+        began = time.perf_counter()
+        tags = [shield._tags(html) for html in batch]
+        tagged = time.perf_counter()
+        input_ids = [shield.tag_tokenizer.encode(tag_list) for tag_list in tags]
+        ids, masks = _padded(input_ids, shield.tag_tokenizer.pad)
+        tokenized = time.perf_counter()
+        backend(ids, masks, np.zeros_like(ids))
+        finished = time.perf_counter()
+        tags_seconds += tagged - began
+        tokenize_seconds += tokenized - tagged
+        forward_seconds += finished - tokenized
+        latencies.extend([finished - began] * len(batch))
+    return {
+        "latencies": latencies,
+        "tags_seconds": tags_seconds,
+        "tokenize_seconds": tokenize_seconds,
+        "forward_seconds": forward_seconds,
+    }
+
+
+def _threaded(shield: Shield, threads: int):
+    """限制为 threads 个计算线程的后端"""
+    if isinstance(shield.backend, OnnxBackend):
+        return OnnxBackend(shield.backend.path, intra_threads=threads, inter_threads=1)
+    if isinstance(shield.backend, TorchBackend):
+        shield.backend._torch.set_num_threads(threads)
+    return shield.backend
+
+
+def _bench_variant(name: str, args, pages: list) -> dict:
+    """在子进程中测试一个变体，返回 {"runs": [...], "skipped": 原因或 None, "max_rss_bytes": ...}"""
+    base_rss = _max_rss()  # 导入模块后、加载模型前
+    try:
+        shield = _load(name)
+    except Exception as e:
+        # 没有安装 PyTorch 或 ONNX Runtime、没有模型文件时跳过该变体
+        print(f"跳过 {name}: {e}", flush=True)
+        return {"runs": [], "skipped": f"{type(e).__name__}: {e}"}
+    load_rss = _max_rss() - base_rss
+    records = []
+    for threads in args.threads:
+        backend = _threaded(shield, threads)
+        for batch_size in args.batch_sizes:
+            # 先跑一批预热，不计入结果
+            _run_batches(shield, backend, pages[:batch_size], batch_size)
+            runs = [
+                _run_batches(shield, backend, pages, batch_size)
+                for _ in range(args.repeat)
+            ]
+            latencies = [value for run in runs for value in run["latencies"]]
+            seconds = [
+                run["tags_seconds"] + run["tokenize_seconds"] + run["forward_seconds"]
+                for run in runs
+            ]
+            best = runs[seconds.index(min(seconds))]
+            record = {
+                "variant": name,
+                "backend": shield.backend_name,
+                "threads": threads,
+                "batch_size": batch_size,
+                "docs": len(pages),
+                "seconds": min(seconds),
+                "median_seconds": statistics.median(seconds),
+                "docs_per_s": len(pages) / min(seconds),
+                # 预处理与前向计算分开计时，取总耗时最短的一次
+                "tags_seconds": best["tags_seconds"],
+                "tokenize_seconds": best["tokenize_seconds"],
+                "forward_seconds": best["forward_seconds"],
+                "p50_ms": _percentile(latencies, 50) * 1e3,
+                "p95_ms": _percentile(latencies, 95) * 1e3,
+                "p99_ms": _percentile(latencies, 99) * 1e3,
+                # 本进程只测这一个变体，峰值 RSS 不受其他变体影响
+                "max_rss_bytes": _max_rss(),
+                "load_rss_bytes": load_rss,
+            }
+            records.append(record)
+            print(
+                f"{name:<12} {threads:>3} 线程 批大小 {batch_size:>4} "
+                f"{record['docs_per_s']:8.1f} 网页/s "
+                f"p50 {record['p50_ms']:8.1f} ms p99 {record['p99_ms']:8.1f} ms "
+                f"预处理 {best['tags_seconds'] + best['tokenize_seconds']:6.2f} s "
+                f"前向 {best['forward_seconds']:6.2f} s",
+                flush=True,
+            )
+    return {"runs": records, "skipped": None, "max_rss_bytes": _max_rss()}
+
+
+def run(args) -> dict:
+    pages = _pages(args.html_dir, args.docs)
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "docs": len(pages),
+            "chars": sum(len(html) for html in pages),
+            "repeat": args.repeat,
+        },
+        "skipped": {},
+        "runs": [],
+        "max_rss_bytes": {},
+    }
+    # spawn 出的新进程不继承本进程和之前变体的内存，ru_maxrss 只反映当前变体
+    context = multiprocessing.get_context("spawn")
+    for name in args.variants:
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(_bench_variant, name, args, pages).result()
+        if result["skipped"] is not None:
+            results["skipped"][name] = result["skipped"]
+            continue
+        results["runs"].extend(result["runs"])
+        results["max_rss_bytes"][name] = result["max_rss_bytes"]
+    return results
+
+
+def compare(results: dict, baseline: dict) -> None:
+    # 按 (变体, 线程数, 批大小) 对比吞吐量；旧的结果没有变体，只有后端名
+    def key(run):
+        return run.get("variant", run["backend"]), run["threads"], run["batch_size"]
+
+    previous = {key(run): run["docs_per_s"] for run in baseline.get("runs", [])}
+    for run in results["runs"]:
+        name, threads, batch_size = key(run)
+        if previous.get(key(run)):
+            change = run["docs_per_s"] / previous[key(run)] - 1
+            print(f"{name:<12} {threads:>3} 线程 批大小 {batch_size:>4} {change:+8.1%}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Shield 网页分类性能基准")
+    parser.add_argument("--html-dir", help="爬取的 HTML 文件目录")
+    parser.add_argument(
+        "--docs", type=int, default=256, help="检测的网页数，页面不够时循环使用"
+    )
+    parser.add_argument(
+        "--batch-sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[1, 8, 32],
+        help="批大小，逗号分隔",
+    )
+    parser.add_argument(
+        "--threads",
+        type=lambda value: [int(count) for count in value.split(",")],
+        default=sorted({1, os.cpu_count() or 1}),
+        help="计算线程数（torch.set_num_threads 或 ONNX Runtime 算子内线程数），逗号分隔",
+    )
+    parser.add_argument(
+        "--variants",
+        type=lambda value: value.split(","),
+        default=list(VARIANTS),
+        help=f"要测试的模型变体，逗号分隔，可选 {','.join(VARIANTS)}，不可用的自动跳过",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数")
+    parser.add_argument("--output", default="shield_bench.json", help="结果 JSON 文件")
+    parser.add_argument("--baseline", help="上一次的结果 JSON 文件，用于对比")
+    args = parser.parse_args(argv)
+    unknown = set(args.variants) - set(VARIANTS)
+    if unknown:
+        parser.error(f"未知的模型变体: {','.join(sorted(unknown))}")
+    if min(args.threads) < 1 or min(args.batch_sizes) < 1:
+        parser.error("线程数和批大小必须为正整数")
+
+    results = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Shield 模型加载耗时对比
+
+在项目根目录运行：
+
+    python -m benchmark.shield_startup --output shield_startup.json
+
+每种加载方式在新的 Python 进程中执行，分别记录导入模块和加载模型的耗时，取中位数：
+
+- pretrained：原先的做法，from_pretrained 读取预训练权重后再 torch.load 微调权重
+- safetensors：只按 config.json 搭建结构，内存映射读取一次微调权重
+- onnx：ONNX Runtime 后端
+- background：SHIELD_WARMUP="background"，构造 Shield 到可以响应健康检查的耗时
+
+第一次运行会把 .pth 转换为 .safetensors，该次不计入；缺少依赖或模型文件的方式跳过
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODES = ("pretrained", "safetensors", "onnx", "background")
+
+# 子进程中执行的代码，最后一行输出 {"import": 秒, "load": 秒}
+_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from config.config import *
+from shield import shield
+imported = time.perf_counter()
+mode = {mode!r}
+if mode == "pretrained":
+    model = shield.Bert_Model(BERT_PATH)
+    model.load_state_dict(shield.torch.load(MODEL_PATH, map_location="cpu"), strict=False)
+elif mode == "safetensors":
+    shield._load_model()
+elif mode == "onnx":
+    shield.Shield(backend="onnx", warmup="eager", workers=0, cascade=False)
+else:
+    shield.Shield(warmup="background", workers=0, cascade=False)
+loaded = time.perf_counter()
+print(json.dumps({{"import": imported - start, "load": loaded - imported}}))
+"""
+
+
+def _measure(mode: str) -> dict:
+    process = subprocess.run(
+        [sys.executable, "-c", _SCRIPT.format(mode=mode)],
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode:
+        # 没有安装 PyTorch 或 ONNX Runtime、没有模型文件
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Shield 模型加载耗时对比")
+    parser.add_argument(
+        "--modes",
+        type=lambda value: value.split(","),
+        default=list(MODES),
+        help=f"加载方式，逗号分隔，可选 {','.join(MODES)}",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="每种方式的进程数")
+    parser.add_argument(
+        "--output", default="shield_startup.json", help="结果 JSON 文件"
+    )
+    args = parser.parse_args(argv)
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"未知的加载方式: {','.join(sorted(unknown))}")
+
+    results = {"runs": [], "skipped": {}}
+    for mode in args.modes:
+        try:
+            # 预热：生成 .safetensors 等派生文件，并让模型文件进入页缓存
+            _measure(mode)
+            runs = [_measure(mode) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            results["skipped"][mode] = str(e)
+            print(f"跳过 {mode}: {e}", flush=True)
+            continue
+        record = {
+            "mode": mode,
+            "import_seconds": statistics.median(run["import"] for run in runs),
+            "load_seconds": statistics.median(run["load"] for run in runs),
+        }
+        results["runs"].append(record)
+        print(
+            f"{mode:<12} 导入 {record['import_seconds']:6.2f} s "
+            f"加载 {record['load_seconds']:6.2f} s",
+            flush=True,
+        )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""sword 关键字检测的性能基准
+
+在项目根目录运行：
+
+    python -m benchmark.sword_bench --output sword_bench.json
+
+对 HTML、中文文本和充满近似前缀的对抗文本三类语料，分别用 1k / 10k / 100k
+个关键字编译索引，记录各实现的吞吐量（MB/s、匹配数/s）、峰值内存和编译时间，
+结果写入 JSON 文件；--baseline 指定上一次的结果文件时打印吞吐量变化
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from sword.index import PREFILTER_MIN_LEN, Automaton, KeywordIndex, build_index, np
+from sword.variants import normalize, variants
+
+KEYWORD_FILE = "data/keyword.txt"
+HTML_FILES = "test_server/templates/*.html"
+COMMON_CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处理府研质信"
+
+
+def _keywords(count: int, seed: int) -> list:
+    # 项目自带的关键字不够时，用关键字中的字符和常用字随机组合补足
+    with open(KEYWORD_FILE, encoding="utf-8") as f:
+        keywords = [line.strip() for line in f if line.strip()]
+    rng = random.Random(seed)
+    rng.shuffle(keywords)
+    chars = list(set("".join(keywords)) | set(COMMON_CHARS))
+    chars.sort()
+    seen = set(keywords)
+    while len(keywords) < count:
+        keyword = "".join(rng.choice(chars) for _ in range(rng.randint(2, 6)))
+        if keyword not in seen:
+            seen.add(keyword)
+            keywords.append(keyword)
+    return keywords[:count]
+
+
+def _html_corpus(size: int, html_dir: str, keywords: list, seed: int) -> str:
+    # 用爬取的网页拼接；没有指定目录时用测试服务器的页面，并在正文里夹杂关键字
+    pattern = os.path.join(html_dir, "**", "*.htm*") if html_dir else HTML_FILES
+    pages = []
+    for filename in sorted(glob.glob(pattern, recursive=True)):
+        with open(filename, encoding="utf-8", errors="ignore") as f:
+            pages.append(f.read())
+    if not pages:
+        raise SystemExit(f"没有找到 HTML 文件: {pattern}")
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        page = rng.choice(pages)
+        cut = rng.randrange(len(page))
+        text = "".join(
+            rng.choice(keywords) if rng.random() < 0.1 else rng.choice(COMMON_CHARS)
+            for _ in range(50)
+        )
+        parts.append(f"{page[:cut]}<p>{text}</p>{page[cut:]}")
+        length += len(parts[-1])
+    return "".join(parts)[:size]
+
+
+def _text_corpus(size: int, text_file: str, keywords: list, seed: int) -> str:
+    # 中文文本：指定文件时重复读取，否则由常用字、标点和少量关键字组成
+    if text_file:
+        with open(text_file, encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+        if not text:
+            raise SystemExit(f"文本文件为空: {text_file}")
+        return (text * (size // len(text) + 1))[:size]
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        r = rng.random()
+        if r < 0.01:
+            part = rng.choice(keywords)
+        elif r < 0.1:
+            part = rng.choice("，。、；：？！“”\n")
+        else:
+            part = rng.choice(COMMON_CHARS)
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)[:size]
+
+
+def _adversarial_corpus(size: int, keywords: list, seed: int) -> str:
+    # 关键字去掉最后一个字再接一个不匹配的字，自动机不断走深又沿失败链退回
+    rng = random.Random(seed)
+    long = [keyword for keyword in keywords if len(keyword) >= 3] or keywords
+    parts, length = [], 0
+    while length < size:
+        keyword = rng.choice(long)
+        part = keyword[:-1] + rng.choice(COMMON_CHARS)
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)[:size]
+
+
+def _prefiltered(keywords: list) -> KeywordIndex:
+    index = KeywordIndex(build_index(keywords))
+    index.find(
+        " " * PREFILTER_MIN_LEN
+    )  # 预过滤表在第一次长文本查找时生成，计入编译时间
+    return index
+
+
+# 实现名 -> (由关键字构建, 在文本上运行并返回匹配列表)
+IMPLEMENTATIONS = {
+    "index.scan": (
+        lambda keywords: KeywordIndex(build_index(keywords)),
+        lambda index, text: index.scan(text)[0],
+    ),
+    "index.find": (
+        _prefiltered,
+        lambda index, text: index.find(text),
+    ),
+    "automaton": (
+        lambda keywords: Automaton(sorted({normalize(k) for k in keywords})),
+        lambda automaton, text: automaton.find(text),
+    ),
+}
+
+
+def _traced(func, *args):
+    # 用 tracemalloc 记录一次调用期间 Python 分配内存的峰值
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> dict:
+    variants("a")  # 先加载变体表，不计入第一次编译时间
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "numpy": np.__version__ if np is not None else None,
+            "corpus_bytes": args.corpus_size,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "builds": [],
+        "runs": [],
+    }
+    for count in args.sizes:
+        keywords = _keywords(count, args.seed)
+        corpora = {
+            "html": _html_corpus(args.corpus_size, args.html_dir, keywords, args.seed),
+            "zh": _text_corpus(args.corpus_size, args.text_file, keywords, args.seed),
+            "adversarial": _adversarial_corpus(args.corpus_size, keywords, args.seed),
+        }
+        built = {}
+        for name in args.impl:
+            build, _ = IMPLEMENTATIONS[name]
+            start = time.perf_counter()
+            matcher = build(keywords)
+            seconds = time.perf_counter() - start
+            _, peak = _traced(build, keywords)
+            built[name] = matcher
+            results["builds"].append(
+                {
+                    "impl": name,
+                    "keywords": count,
+                    "seconds": seconds,
+                    "peak_bytes": peak,
+                }
+            )
+            print(f"build {name:<12} {count:>7} 个关键字 {seconds:8.2f} s", flush=True)
+
+        for corpus, text in corpora.items():
+            size = len(text.encode("utf-8"))
+            for name in args.impl:
+                _, find = IMPLEMENTATIONS[name]
+                matcher = built[name]
+                times = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    matches = find(matcher, text)
+                    times.append(time.perf_counter() - start)
+                _, peak = _traced(find, matcher, text)
+                best = min(times)
+                record = {
+                    "corpus": corpus,
+                    "keywords": count,
+                    "impl": name,
+                    "bytes": size,
+                    "seconds": best,
+                    "median_seconds": statistics.median(times),
+                    "mb_per_s": size / best / 1e6,
+                    "matches": len(matches),
+                    "matches_per_s": len(matches) / best,
+                    "peak_bytes": peak,
+                }
+                results["runs"].append(record)
+                print(
+                    f"{corpus:<12} {count:>7} {name:<12} "
+                    f"{record['mb_per_s']:8.2f} MB/s {record['matches_per_s']:12.0f} 匹配/s "
+                    f"峰值 {peak / 1e6:8.1f} MB",
+                    flush=True,
+                )
+    # ru_maxrss 在 Linux 上以 KB 为单位
+    results["meta"]["max_rss_bytes"] = (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    )
+    return results
+
+
+def compare(results: dict, baseline: dict) -> None:
+    # 按 (语料, 关键字数, 实现) 对比吞吐量
+    previous = {
+        (run["corpus"], run["keywords"], run["impl"]): run["mb_per_s"]
+        for run in baseline.get("runs", [])
+    }
+    for run in results["runs"]:
+        key = (run["corpus"], run["keywords"], run["impl"])
+        if key in previous and previous[key]:
+            change = run["mb_per_s"] / previous[key] - 1
+            print(f"{key[0]:<12} {key[1]:>7} {key[2]:<12} {change:+8.1%}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="sword 关键字检测性能基准")
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[1000, 10000, 100000],
+        help="关键字数量，逗号分隔",
+    )
+    parser.add_argument(
+        "--impl",
+        type=lambda value: value.split(","),
+        default=list(IMPLEMENTATIONS),
+        help=f"要测试的实现，逗号分隔，可选 {','.join(IMPLEMENTATIONS)}",
+    )
+    parser.add_argument(
+        "--corpus-size", type=int, default=2_000_000, help="每类语料的字符数"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快")
+    parser.add_argument("--html-dir", help="爬取的 HTML 文件目录")
+    parser.add_argument("--text-file", help="中文文本文件")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="sword_bench.json", help="结果 JSON 文件")
+    parser.add_argument("--baseline", help="上一次的结果 JSON 文件，用于对比")
+    args = parser.parse_args(argv)
+    unknown = set(args.impl) - set(IMPLEMENTATIONS)
+    if unknown:
+        parser.error(f"未知的实现: {','.join(sorted(unknown))}")
+
+    results = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Sword 关键字匹配的正确性检查
+
+在项目根目录运行：
+
+    python -m benchmark.sword_check --trials 2000
+
+用逐个关键字、逐个起点比较的暴力实现作为参照，在随机关键字和随机文本上检查
+KeywordIndex 的三条匹配路径结果完全一致：
+
+- scan：整段逐字符扫描
+- prefilter：从预过滤得到的候选起点运行自动机（find 处理长文本时使用）
+- stream：把文本随机切成几段，在段之间传递状态分段扫描（Matcher.stream 使用）
+
+随机文本包含大小写、全角和繁体写法、零宽字符和标点分隔，并按列表过滤。
+另外检查几个固定的例子：分隔字符的跳过规则，以及返回的关键字是规范形式
+（"时事类：" 返回 "时事类:"，"辛灝年" 返回 "辛灏年"）。
+修改索引、分隔字符规则或写法折叠后运行；结果不一致时退出码为 1
+"""
+
+import argparse
+import random
+import sys
+
+from sword.index import SEPARATOR_GAP, KeywordIndex, build_index
+from sword.variants import _traditional, normalize, separators
+
+try:
+    from sword.prefilter import Prefilter
+except ImportError:  # 没有安装 numpy
+    Prefilter = None
+
+# 随机关键字的字符，含会与分隔字符冲突的 "-" 和 "."
+KEYWORD_CHARS = "abcx1特供台独习近平-."
+# 随机文本的字符：关键字字符、其他写法、分隔字符、空白和 HTML 标记字符
+TEXT_CHARS = list(KEYWORD_CHARS + 'ABXＡｂ１習臺獨*_，。|\u200b\u00ad\ufeff <>="z中')
+LISTS = ("default", "politics", "ads")
+
+# (关键字, 文本, 期望的匹配, 是否需要繁简对照表)
+CASES = [
+    (["taiwan"], "taiwan", [(0, "taiwan")], False),
+    (["taiwan"], "TaiWan", [(0, "taiwan")], False),
+    (["taiwan"], "ＴＡＩＷＡＮ", [(0, "taiwan")], False),
+    # 拉丁字母和数字之间不跳过分隔字符，否则会跨越单词匹配
+    (["taiwan"], "tai wan", [], False),
+    (["taiwan"], "tai-wan", [], False),
+    (["fuck"], "F.U.C.K", [], False),
+    (["特供"], "特\u200b供", [(0, "特供")], False),
+    (["特供"], "x特，供y", [(1, "特供")], False),
+    (["特供"], "特**供", [(0, "特供")], False),
+    (["特供"], "特***供", [], False),
+    # 空白和 HTML 标记不是分隔字符
+    (["特供"], "特 供", [], False),
+    (["特供"], "特<b>供", [], False),
+    (["习近平"], "习.近.平", [(0, "习近平")], False),
+    (["a-b"], "a-b", [(0, "a-b")], False),
+    (["falungong"], "ＦＡＬＵＮＧＯＮＧ", [(0, "falungong")], False),
+    # 返回的关键字是规范形式，不是添加时或文本中的写法
+    (["时事类："], "时事类:", [(0, "时事类:")], False),
+    (["时事类："], "时事类：", [(0, "时事类:")], False),
+    (["习近平"], "習近平", [(0, "习近平")], True),
+    (["辛灝年"], "辛灝年", [(0, "辛灏年")], True),
+    (["辛灝年"], "辛灏年", [(0, "辛灏年")], True),
+    (["時事類："], "时事类:", [(0, "时事类:")], True),
+]
+
+
+class Reference:
+    """暴力参照：逐个关键字、逐个起点比较，不使用索引的任何数据结构"""
+
+    SEPARATOR = object()
+
+    def __init__(self, keywords: dict) -> None:
+        self.entries = {}
+        for keyword, lists in keywords.items():
+            self.entries.setdefault(normalize(keyword), set()).update(lists)
+        self.chars = set("".join(self.entries))
+        self.separators = separators()
+
+    def _key(self, char):
+        # 文本字符按哪个关键字字符匹配；分隔字符返回 SEPARATOR，都不是返回 None
+        if char in self.chars:
+            return char
+        canonical = normalize(char)
+        if len(canonical) == 1 and canonical in self.chars:
+            return canonical
+        return self.SEPARATOR if char in self.separators else None
+
+    @staticmethod
+    def _latin(char: str) -> bool:
+        return char.isascii() and char.isalnum()
+
+    def _matches_at(self, keys: list, i: int, keyword: str) -> bool:
+        j = i
+        for n, char in enumerate(keyword):
+            if n:
+                gap = 0
+                while j < len(keys) and keys[j] is self.SEPARATOR:
+                    j += 1
+                    gap += 1
+                if gap > SEPARATOR_GAP:
+                    return False
+                if gap and self._latin(keyword[n - 1]) and self._latin(char):
+                    return False
+            if j >= len(keys) or keys[j] != char:
+                return False
+            j += 1
+        return True
+
+    def find(self, text: str, lists=None) -> list:
+        keys = [self._key(char) for char in text]
+        return sorted(
+            (i, keyword)
+            for keyword, names in self.entries.items()
+            if lists is None or names & set(lists)
+            for i in range(len(text))
+            if self._matches_at(keys, i, keyword)
+        )
+
+
+def _prefiltered(index: KeywordIndex, text: str, wanted) -> list:
+    # 与 KeywordIndex._prefiltered 相同，但不因候选过多退回整段扫描，
+    # 短文本和稠密文本也走从候选起点运行自动机的路径
+    matches = []
+    end = 0
+    for start in index._prefilter.candidates(text).tolist():
+        if start >= end:
+            end = index._run(text, start, matches, wanted)
+    return matches
+
+
+def _streamed(index: KeywordIndex, text: str, wanted, rng: random.Random) -> list:
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(1, 3)))
+    matches, state, skipped = [], 0, []
+    for start, end in zip([0] + cuts, cuts + [len(text)]):
+        found, state = index.scan(text[start:end], state, start, skipped, wanted)
+        matches += found
+    return matches
+
+
+def _random_keywords(rng: random.Random) -> dict:
+    keywords = {}
+    for _ in range(rng.randint(1, 15)):
+        keyword = "".join(rng.choice(KEYWORD_CHARS) for _ in range(rng.randint(1, 4)))
+        # 首字符不是 "-" 和 "."，避免随机文本中几乎处处有匹配
+        if keyword[0] in "-.":
+            continue
+        names = rng.sample(LISTS, rng.randint(1, 2))
+        keywords.setdefault(keyword, set()).update(names)
+    return keywords or {"ab": {"default"}}
+
+
+def _check(name: str, expected: list, actual: list, failures: list, context) -> None:
+    if sorted(actual) != expected:
+        failures.append((name, context, expected, sorted(actual)))
+
+
+def check_cases(failures: list) -> int:
+    checked = 0
+    traditional = bool(_traditional())
+    if not traditional:
+        print("没有繁简对照表，跳过繁体写法的例子", flush=True)
+    for keywords, text, expected, needs_table in CASES:
+        if needs_table and not traditional:
+            continue
+        index = KeywordIndex(build_index(keywords))
+        _check("case", expected, index.find(text), failures, (keywords, text))
+        _check(
+            "reference",
+            expected,
+            Reference({k: ["default"] for k in keywords}).find(text),
+            failures,
+            (keywords, text),
+        )
+        checked += 1
+    if normalize("时事类：") != "时事类:":
+        failures.append(("normalize", "时事类：", "时事类:", normalize("时事类：")))
+    return checked
+
+
+def check_random(trials: int, seed: int, failures: list) -> int:
+    rng = random.Random(seed)
+    checked = 0
+    for _ in range(trials):
+        keywords = _random_keywords(rng)
+        index = KeywordIndex(build_index(keywords))
+        reference = Reference(keywords)
+        if Prefilter is not None:
+            index._prefilter = Prefilter(index)
+        for _ in range(5):
+            text = "".join(rng.choice(TEXT_CHARS) for _ in range(rng.randint(0, 60)))
+            lists = None if rng.random() < 0.5 else rng.sample(LISTS, 1)
+            wanted = None if lists is None else index.mask(lists)
+            expected = reference.find(text, lists)
+            context = (keywords, text, lists)
+            _check(
+                "scan", expected, index.scan(text, wanted=wanted)[0], failures, context
+            )
+            if Prefilter is not None:
+                _check(
+                    "prefilter",
+                    expected,
+                    _prefiltered(index, text, wanted),
+                    failures,
+                    context,
+                )
+            _check(
+                "stream",
+                expected,
+                _streamed(index, text, wanted, rng),
+                failures,
+                context,
+            )
+            checked += 1
+        # 长文本走 find 的自适应路径
+        text = "".join(rng.choice(TEXT_CHARS) for _ in range(2000))
+        _check(
+            "find",
+            reference.find(text),
+            index.find(text),
+            failures,
+            (keywords, "<长文本>"),
+        )
+    return checked
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Sword 关键字匹配的正确性检查")
+    parser.add_argument("--trials", type=int, default=2000, help="随机关键字集合数")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    args = parser.parse_args(argv)
+
+    failures = []
+    cases = check_cases(failures)
+    print(f"固定例子 {cases} 个", flush=True)
+    texts = check_random(args.trials, args.seed, failures)
+    paths = "scan、stream" if Prefilter is None else "scan、prefilter、stream、find"
+    print(f"随机文本 {texts} 段，比较 {paths}", flush=True)
+    for name, context, expected, actual in failures[:10]:
+        print(f"不一致 [{name}] {context!r}\n  期望 {expected}\n  实际 {actual}")
+    if failures:
+        print(f"共 {len(failures)} 处不一致")
+        sys.exit(1)
+    print("全部一致")
+
+
+if __name__ == "__main__":
+    main()
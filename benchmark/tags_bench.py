@@ -0,0 +1,103 @@
+"""Shield 预处理（标签序列提取）的性能基准
+
+在项目根目录运行：
+
+    python -m benchmark.tags_bench --html-dir path/to/pages --output tags_bench.json
+
+比较 BeautifulSoup 整页解析和 shield.tags.extract_tags 截断解析的耗时，
+并检查两者得到的标签序列前缀一致；没有指定目录时把测试服务器的页面重复拼接成大页面
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+from bs4 import BeautifulSoup
+from shield.tags import TAG_LIMIT, extract_tags
+
+HTML_FILES = "test_server/templates/*.html"
+
+
+def _pages(html_dir: str, min_size: int) -> dict:
+    pattern = os.path.join(html_dir, "**", "*.htm*") if html_dir else HTML_FILES
+    pages = {}
+    for filename in sorted(glob.glob(pattern, recursive=True)):
+        with open(filename, encoding="utf-8", errors="ignore") as f:
+            html = f.read()
+        if html and len(html) < min_size:
+            # 小页面重复拼接，模拟大页面
+            html = html * (min_size // len(html) + 1)
+        if html:
+            pages[filename] = html
+    if not pages:
+        raise SystemExit(f"没有找到 HTML 文件: {pattern}")
+    return pages
+
+
+def _bs4_tags(html: str) -> list:
+    # Shield 原先的做法：解析整页再取全部标签
+    return [tag.name for tag in BeautifulSoup(html, "html.parser").find_all(True)]
+
+
+def _timed(func, html: str, repeat: int) -> tuple:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(html)
+        times.append(time.perf_counter() - start)
+    return result, min(times), statistics.median(times)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Shield 标签序列提取性能基准")
+    parser.add_argument("--html-dir", help="爬取的 HTML 文件目录")
+    parser.add_argument(
+        "--min-size", type=int, default=500_000, help="小于该字符数的页面重复拼接"
+    )
+    parser.add_argument("--limit", type=int, default=TAG_LIMIT, help="提取的标签数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快")
+    parser.add_argument("--output", default="tags_bench.json", help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for filename, html in _pages(args.html_dir, args.min_size).items():
+        expected, bs4_best, bs4_median = _timed(_bs4_tags, html, args.repeat)
+        tags, best, median = _timed(
+            lambda text: extract_tags(text, args.limit), html, args.repeat
+        )
+        run = {
+            "page": filename,
+            "chars": len(html),
+            "tags": len(expected),
+            "bs4_seconds": bs4_best,
+            "bs4_median_seconds": bs4_median,
+            "extract_seconds": best,
+            "extract_median_seconds": median,
+            "speedup": bs4_best / best,
+            "identical": tags == expected[: args.limit],
+        }
+        runs.append(run)
+        print(
+            f"{os.path.basename(filename):<30} {len(html):>10} 字符 "
+            f"BeautifulSoup {bs4_best * 1000:9.2f} ms  extract_tags {best * 1000:7.2f} ms  "
+            f"{run['speedup']:8.1f} 倍  {'一致' if run['identical'] else '不一致'}",
+            flush=True,
+        )
+
+    results = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "limit": args.limit,
+        "repeat": args.repeat,
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    if not all(run["identical"] for run in runs):
+        raise SystemExit("标签序列与 BeautifulSoup 不一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from spider.spider import spider
-from sword.sword import sword
+from sword.sword import sword_many
 from shield.shield import Shield
 from toTable import write2table
 from time import time
@@ -26,6 +26,7 @@ if __name__ == "__main__":
     t = time()
     logging.info("检查中...")
     if isinstance(response, dict):
+        pages = {}
         for url in response:
             if isinstance(response[url], str) and response[url].startswith(
                 "错误:"
@@ -46,11 +47,16 @@ if __name__ == "__main__":
                 continue
 
             result[url] = {}
-            result[url]["sword"] = sword(html_content)
-            shield_prediction_label = shield_model(
-                html_content
-            )  # 使用 __call__ 代替 predict
-            result[url]["shield"] = shield_prediction_label  # 直接分配返回的标签
+            pages[url] = html_content
+
+        # 敏感词检测分散到多个进程，恶意网页检测按批进行，结果顺序均与 pages 一致
+        sword_results = sword_many(pages.values())
+        shield_results = shield_model.predict_batch(list(pages.values()))
+        for url, sword_result, shield_result in zip(
+            pages, sword_results, shield_results
+        ):
+            result[url]["sword"] = sword_result
+            result[url]["shield"] = shield_result["label"]
 
     else:
         logging.error("错误：爬虫未返回预期的字典格式。")  # 使用日志记录
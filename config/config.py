@@ -1,11 +1,56 @@
 WIDTH = 1920
 HEIGHT = 1080
 LOAD_TIME = 5
-PICKLE_FILE = "keyword_tree.pickle"
+PICKLE_FILE = "data/keyword_tree.pickle"  # 旧版关键字树，仅用于一次性转换
+INDEX_FILE = "data/keyword_index.bin"  # 关键字索引，由 create_sword_by 生成
+DELTA_FILE = "data/keyword_index.delta"  # 运行中增删关键字的增量日志
+LOCK_FILE = "data/keyword_index.lock"  # 多个进程更新索引和增量日志时加的文件锁
+DELTA_LIMIT = 1000  # 增量超过该数量时合并进索引文件
+RELOAD_INTERVAL = 1  # 检查其他进程更新的间隔（秒）
+VARIANT_FILE = "data/variants.txt"  # 繁简对照表，编译索引时加入繁体写法
+DEFAULT_LIST = "default"  # 未指定列表时关键字所属的列表
+SWORD_PARALLEL_MIN_CHARS = 1 << 20  # sword_many 的文本总字符数少于该值时不使用进程池
 
 BERT_PATH = "bert_model/"  # 该文件夹下存放三个文件（'vocab.txt', 'pytorch_model.bin', 'config.json'）
 # DATA_PATH = "data/tags_data.txt" # 数据路径
-DATA_PATH = "data/test_data.txt"
+DATA_PATH = "data/test_data.txt"  # 数据文件，或 shield.corpus 生成的分片目录
 MAX_LEN = 128
 BATCH_SIZE = 8
 EPOCHS = 10
+TRAIN_BUCKETING = False  # 按长度分桶组批，减少批内补齐
+TRAIN_BF16 = False  # CPU 训练时使用 bfloat16 自动混合精度
+GRAD_ACCUM_STEPS = 1  # 梯度累积步数，等效批大小为 BATCH_SIZE × 该值
+DATASET_CACHE_DIR = "data/dataset_cache"  # 分词后的训练数据缓存目录
+DATASET_WORKERS = 0  # 生成训练数据缓存时的分词进程数，0 表示 CPU 核数
+CORPUS_WORKERS = 0  # 由网页生成训练数据时提取标签的进程数，0 表示 CPU 核数
+CORPUS_SHARD_LINES = 50_000  # 生成的训练数据每个分片文件的行数
+MODEL_PATH = "best_bert_model.pth"  # 训练好的 Shield 模型权重
+QUANTIZED_MODEL_PATH = "best_bert_model.int8.pth"  # INT8 动态量化后的模型
+SHIELD_WARMUP = "eager"  # 模型加载时机："eager"、"background" 或 "lazy"
+SHIELD_STUDENT = False  # 推理时使用蒸馏得到的学生模型代替 BERT-base
+STUDENT_MODEL_PATH = "best_student_model.pth"  # 蒸馏得到的学生模型权重
+STUDENT_LAYERS = 4  # 学生模型的编码器层数，从教师模型中均匀选取这些层初始化
+DISTILL_TEMPERATURE = 2.0  # 蒸馏温度，越高教师的软标签越平滑
+DISTILL_ALPHA = 0.5  # 蒸馏损失中拟合教师软标签所占的权重，其余为真实标签
+SHIELD_QUANTIZE = False  # 推理时使用 INT8 量化模型，不存在时由 MODEL_PATH 生成
+QUANTIZE_TOLERANCE = 0.01  # 量化后准确率下降和判定改变的比例上限
+SHIELD_BACKEND = "torch"  # 推理后端："torch" 或 "onnx"（ONNX Runtime，不需要 PyTorch）
+ONNX_MODEL_PATH = "best_bert_model.onnx"  # 导出的 ONNX 模型，不存在时由 MODEL_PATH 导出
+ONNX_INTRA_THREADS = 0  # ONNX Runtime 单个算子内的线程数，0 表示按 CPU 核数
+ONNX_INTER_THREADS = 0  # ONNX Runtime 算子之间的线程数，0 表示默认
+ONNX_TOLERANCE = 1e-4  # ONNX 与 PyTorch 输出 logits 的最大允许差值
+SHIELD_BATCH_SIZE = 32  # Shield 批量推理时每次前向计算的网页数
+SHIELD_WORKERS = 0  # 推理进程数，0 表示在服务进程内推理
+SHIELD_WORKER_THREADS = 0  # 每个推理进程的线程数，0 表示 CPU 核数除以进程数
+SHIELD_CASCADE = False  # 先用轻量模型判定，没有把握的网页才交给 BERT
+CASCADE_MODEL_PATH = "cascade_model.pkl"  # 级联的轻量模型（标签 n-gram + 逻辑回归）
+CASCADE_NGRAM = 3  # 轻量模型使用 1 到该值个连续标签名作为特征
+CASCADE_BENIGN_THRESHOLD = 0.98  # 判为正常网页的概率不低于该值时不再调用 BERT
+CASCADE_MALICIOUS_THRESHOLD = 0.99  # 判为恶意网页的概率不低于该值时不再调用 BERT
+SHIELD_CACHE_SIZE = 100000  # 进程内判定缓存的条数，0 表示不缓存
+SHIELD_CACHE_DB = None  # 磁盘判定缓存的 sqlite 文件，None 表示不使用
+SHIELD_CACHE_DB_SIZE = 1000000  # 磁盘判定缓存的条数上限
+SHIELD_NEIGHBOUR_SIZE = 0  # 近似重复索引的条数上限，0 表示不使用；启用前先用 Trainer().check_neighbours() 检查
+SHIELD_NEIGHBOUR_DISTANCE = 3  # 与已判定网页的 SimHash 距离不超过该值时复用判定
+SHIELD_NEIGHBOUR_CONFIDENCE = 0.95  # 概率不低于该值的判定才会被近似重复的网页复用
+SHIELD_MAX_WAIT = 0.01  # 并发请求凑批时最多等待的时间（秒）
@@ -0,0 +1,106 @@
+import contextlib
+import os
+import threading
+import numpy as np
+from config.config import *
+
+# 推理后端：输入 input_ids, attention_mask, token_type_ids（int64 数组，形状均为
+# [批大小, 序列长度]），返回 logits（float32 数组，形状为 [批大小, 类别数]）；
+# fork(threads) 返回可在 fork 出的子进程中使用的后端
+INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+
+class TorchBackend:
+    """用 PyTorch 模型推理，也是其他后端的对照基准"""
+
+    def __init__(self, model, device) -> None:
+        import torch
+
+        self._torch = torch
+        self.model = model
+        self.device = device
+
+    def __call__(self, input_ids, attention_mask, token_type_ids):
+        torch = self._torch
+        inputs = [
+            torch.from_numpy(array).to(self.device)
+            for array in (input_ids, attention_mask, token_type_ids)
+        ]
+        with torch.inference_mode():
+            logits = self.model(*inputs)
+        return logits.float().cpu().numpy()
+
+    def fork(self, threads: int):
+        # 权重以写时复制的方式与父进程共享，只限制本进程的线程数
+        self._torch.set_num_threads(threads)
+        return self
+
+
+class OnnxBackend:
+    """用 ONNX Runtime 在 CPU 上推理，不需要安装 PyTorch"""
+
+    def __init__(
+        self,
+        path: str = ONNX_MODEL_PATH,
+        intra_threads: int = ONNX_INTRA_THREADS,
+        inter_threads: int = ONNX_INTER_THREADS,
+    ) -> None:
+        import onnxruntime as ort
+
+        self.path = path
+        options = ort.SessionOptions()
+        # 0 表示由 ONNX Runtime 按 CPU 核数决定
+        options.intra_op_num_threads = intra_threads
+        options.inter_op_num_threads = inter_threads
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, input_ids, attention_mask, token_type_ids):
+        inputs = (input_ids, attention_mask, token_type_ids)
+        feed = {
+            name: np.asarray(array, dtype=np.int64)
+            for name, array in zip(INPUT_NAMES, inputs)
+        }
+        return self.session.run(["logits"], feed)[0]
+
+    def fork(self, threads: int):
+        # ONNX Runtime 的会话不能跨 fork 使用，子进程重新创建
+        return OnnxBackend(self.path, intra_threads=threads, inter_threads=1)
+
+
+@contextlib.contextmanager
+def replacing(path: str):
+    """产生同一目录下的临时文件名，写完后再替换 path
+
+    其他进程按大小和修改时间判断模型文件是否更新，不能让它们读到写了一半的文件
+    """
+    tmp = f"{path}.tmp{os.getpid()}-{threading.get_ident()}"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def export_onnx(model, path: str = ONNX_MODEL_PATH, opset: int = 14) -> None:
+    """把 Bert_Model 导出为 ONNX，批大小和序列长度均可变"""
+    import torch
+
+    model.eval()
+    sample = torch.ones((1, 8), dtype=torch.long)
+    axes = {0: "batch", 1: "sequence"}
+    with replacing(path) as tmp:
+        torch.onnx.export(
+            model,
+            (sample, sample, torch.zeros_like(sample)),
+            tmp,
+            input_names=INPUT_NAMES,
+            output_names=["logits"],
+            dynamic_axes={
+                **{name: axes for name in INPUT_NAMES},
+                "logits": {0: "batch"},
+            },
+            opset_version=opset,
+        )
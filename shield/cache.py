@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from config.config import *
+
+PURGE_EVERY = 1000  # 磁盘缓存每写入这么多条检查一次是否超出上限
+
+
+def weights_version(path: str, tag: str = "") -> str:
+    """模型文件内容的哈希，重新训练或替换权重后自然得到新的版本"""
+    digest = hashlib.blake2b(tag.encode("utf-8"), digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_version(path: str, tag: str = "") -> str:
+    """由文件的路径、大小和修改时间得到版本，不读取内容，用于几百 MB 的模型文件"""
+    stat = os.stat(path)
+    key = f"{tag}:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class VerdictCache:
+    """Shield 判定结果缓存：进程内 LRU，加上可选的 sqlite 磁盘缓存
+
+    键是实际输入模型的 WordPiece 编号序列与模型权重版本的哈希，
+    同一模板生成的网页截断后的标签序列相同，可以直接复用判定；
+    权重改变后版本不同，旧的结果不会再被命中，磁盘中其他版本的记录在打开时清除
+    """
+
+    def __init__(
+        self,
+        version: str,
+        size: int = SHIELD_CACHE_SIZE,
+        path: str = SHIELD_CACHE_DB,
+        disk_size: int = SHIELD_CACHE_DB_SIZE,
+    ) -> None:
+        self.version = version
+        self.size = size
+        self.disk_size = disk_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(
+            ("hits", "disk_hits", "misses", "evictions", "disk_evictions"), 0
+        )
+        self._writes = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts (key BLOB PRIMARY KEY, "
+                "version TEXT, label INTEGER, probability REAL, created REAL)"
+            )
+            self._db.execute("DELETE FROM verdicts WHERE version != ?", (version,))
+            self._db.commit()
+
+    def key(self, input_ids) -> bytes:
+        digest = hashlib.blake2b(self.version.encode("ascii"), digest_size=16)
+        digest.update(array("I", input_ids).tobytes())
+        return digest.digest()
+
+    def get(self, key: bytes):
+        """返回 (标签编号, 概率)，未命中时返回 None"""
+        with self._lock:
+            verdict = self._memory.get(key)
+            if verdict is not None:
+                self._memory.move_to_end(key)
+                self._counts["hits"] += 1
+                return verdict
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT label, probability FROM verdicts WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._counts["disk_hits"] += 1
+                    self._remember(key, tuple(row))
+                    return tuple(row)
+            self._counts["misses"] += 1
+            return None
+
+    def put(self, key: bytes, label: int, probability: float) -> None:
+        with self._lock:
+            self._remember(key, (label, probability))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)",
+                    (key, self.version, label, probability, time.time()),
+                )
+                self._db.commit()
+                self._writes += 1
+                if self._writes % PURGE_EVERY == 0:
+                    self._purge()
+
+    def _remember(self, key: bytes, verdict: tuple) -> None:
+        if self.size <= 0:
+            return
+        self._memory[key] = verdict
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+            self._counts["evictions"] += 1
+
+    def _purge(self) -> None:
+        # 超出上限时删除最早写入的记录
+        (count,) = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()
+        if count > self.disk_size:
+            self._db.execute(
+                "DELETE FROM verdicts WHERE key IN "
+                "(SELECT key FROM verdicts ORDER BY created LIMIT ?)",
+                (count - self.disk_size,),
+            )
+            self._db.commit()
+            self._counts["disk_evictions"] += count - self.disk_size
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counts)
+            lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = (
+                (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0
+            )
+            stats["size"] = len(self._memory)
+            if self._db is not None:
+                (stats["disk_size"],) = self._db.execute(
+                    "SELECT COUNT(*) FROM verdicts"
+                ).fetchone()
+            stats["version"] = self.version
+            return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM verdicts")
+                self._db.commit()
@@ -0,0 +1,90 @@
+import pickle
+from sklearn.metrics import accuracy_score
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from config.config import *
+from shield.tags import TAG_LIMIT
+
+
+class CascadeModel:
+    """级联的第一级：标签名 n-gram 的哈希特征 + 逻辑回归
+
+    只看与 BERT 输入相同的前 TAG_LIMIT 个标签；判为正常网页的概率不低于 benign，
+    或判为恶意网页的概率不低于 malicious 时直接给出判定，其余网页交给 BERT
+    """
+
+    def __init__(
+        self,
+        classifier=None,
+        benign: float = CASCADE_BENIGN_THRESHOLD,
+        malicious: float = CASCADE_MALICIOUS_THRESHOLD,
+    ) -> None:
+        # 正则化较弱，概率更接近 0 或 1，有把握的网页更多
+        self.classifier = classifier or LogisticRegression(C=10, max_iter=1000)
+        self.benign = benign
+        self.malicious = malicious
+        # 哈希特征不需要保存词表，只有分类器需要训练和保存
+        self.vectorizer = HashingVectorizer(
+            token_pattern=r"\S+",
+            lowercase=False,
+            ngram_range=(1, CASCADE_NGRAM),
+            n_features=1 << 20,
+            alternate_sign=False,
+        )
+
+    def _features(self, tags: list):
+        # 每个元素为标签名列表或以空格连接的字符串
+        texts = [
+            " ".join((t.split() if isinstance(t, str) else t)[:TAG_LIMIT]) for t in tags
+        ]
+        return self.vectorizer.transform(texts)
+
+    def fit(self, tags: list, labels: list) -> "CascadeModel":
+        self.classifier.fit(self._features(tags), labels)
+        return self
+
+    def predict(self, tags: list):
+        return self.classifier.predict(self._features(tags))
+
+    def predict_proba(self, tags: list):
+        """各网页属于 classifier.classes_ 中各类的概率"""
+        return self.classifier.predict_proba(self._features(tags))
+
+    def decide(self, tags: list) -> list:
+        """有把握的网页为 (标签编号, 概率)，其余为 None"""
+        classes = self.classifier.classes_
+        decisions = []
+        for row in self.predict_proba(tags):
+            best = int(row.argmax())
+            label, probability = int(classes[best]), float(row[best])
+            threshold = self.benign if label == 1 else self.malicious
+            decisions.append((label, probability) if probability >= threshold else None)
+        return decisions
+
+    def save(self, path: str = CASCADE_MODEL_PATH) -> None:
+        with open(path, "wb") as f:
+            pickle.dump(self.classifier, f)
+
+    @classmethod
+    def load(cls, path: str = CASCADE_MODEL_PATH, **thresholds) -> "CascadeModel":
+        with open(path, "rb") as f:
+            return cls(pickle.load(f), **thresholds)
+
+
+def cascade_report(cascade, tags: list, labels: list, bert_pred: list) -> dict:
+    """已知真实标签和 BERT 判定时，统计级联调用 BERT 的比例和判定的一致性"""
+    decisions = cascade.decide(tags)
+    final = [d[0] if d else b for d, b in zip(decisions, bert_pred)]
+    decided = [(d[0], b) for d, b in zip(decisions, bert_pred) if d]
+    bert_calls = len(labels) - len(decided)
+    return {
+        "pages": len(labels),
+        "bert_calls": bert_calls,
+        "bert_rate": bert_calls / len(labels),
+        # 轻量模型直接判定的网页中与 BERT 判定相同的比例
+        "agreement": (
+            sum(a == b for a, b in decided) / len(decided) if decided else 1.0
+        ),
+        "bert_accuracy": accuracy_score(labels, bert_pred),
+        "cascade_accuracy": accuracy_score(labels, final),
+    }
@@ -0,0 +1,267 @@
+"""由标注好的网页生成 Shield 训练数据
+
+在项目根目录运行：
+
+    python -m shield.corpus path/to/pages --output data/corpus
+
+输入为目录、zip 或 tar 压缩包，其中的 .html/.htm 文件各为一个网页，.json 文件为
+spider() 返回的 {URL: HTML} 字典。标签由 --label 指定，或取自最近的名为 0、1、
+malicious、normal 的上级目录。网页在多个进程中提取标签序列，去掉重复的序列并打乱后，
+按 DATA_PATH 的格式（以空格连接的标签名、制表符、标签）写入 part-00000.txt 等分片，
+把 DATA_PATH 设为输出目录即可用于训练。无法解析或不是字典的 .json 文件跳过并计入
+invalid；输出目录已存在时，只有其中是之前生成的语料（有 manifest.json）或指定了
+--force 才会被替换
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tarfile
+import time
+import zipfile
+from collections import Counter
+from config.config import *
+from shield.dataset import SHARD_PATTERN
+from shield.tags import extract_tags
+
+HTML_SUFFIXES = (".html", ".htm")
+SPIDER_SUFFIX = ".json"
+SPIDER_ERROR = "错误:"  # spider() 抓取失败时结果的前缀
+# 目录名 -> 标签编号，与 Shield.label_map 一致
+LABEL_DIRS = {"0": 0, "1": 1, "malicious": 0, "normal": 1}
+
+
+def _label(parts, label):
+    # 指定了标签时直接使用，否则从最近的上级目录名推断
+    if label is not None:
+        return label
+    for part in reversed(parts[:-1]):
+        if part.lower() in LABEL_DIRS:
+            return LABEL_DIRS[part.lower()]
+    return None
+
+
+def _decode(data) -> str:
+    # 标签名都是 ASCII，编码不是 UTF-8 的网页也能得到正确的标签序列
+    return data.decode("utf-8", errors="ignore") if isinstance(data, bytes) else data
+
+
+def _spider_pages(data, label, name: str):
+    try:
+        pages = json.loads(_decode(data))
+    except ValueError:
+        pages = None
+    if not isinstance(pages, dict):
+        # 不是 spider() 的结果，由 build_corpus 计数后跳过
+        yield "invalid", name, label
+        return
+    for html in pages.values():
+        if isinstance(html, str) and html and not html.startswith(SPIDER_ERROR):
+            yield "html", html, label
+
+
+def _pages(source: str, label=None):
+    """依次产生 (类型, 文件路径或网页内容, 标签)，类型为 "path"、"html" 或 "invalid" """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                parts = os.path.relpath(path, source).split(os.sep)
+                suffix = os.path.splitext(name)[1].lower()
+                if suffix in HTML_SUFFIXES:
+                    # 由提取标签的进程自己读取文件
+                    yield "path", path, _label(parts, label)
+                elif suffix == SPIDER_SUFFIX:
+                    with open(path, "rb") as f:
+                        yield from _spider_pages(f.read(), _label(parts, label), path)
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield from _member(info.filename, archive.read(info), label)
+    elif tarfile.is_tarfile(source):
+        # 流式读取，压缩的 tar 包也只解压一遍
+        with tarfile.open(source, "r|*") as archive:
+            for info in archive:
+                if info.isfile():
+                    data = archive.extractfile(info).read()
+                    yield from _member(info.name, data, label)
+    elif os.path.splitext(source)[1].lower() == SPIDER_SUFFIX:
+        with open(source, "rb") as f:
+            yield from _spider_pages(f.read(), label, source)
+    else:
+        raise ValueError(f"不支持的输入: {source}")
+
+
+def _member(name: str, data: bytes, label):
+    parts = name.split("/")
+    suffix = os.path.splitext(name)[1].lower()
+    if suffix in HTML_SUFFIXES:
+        yield "html", data, _label(parts, label)
+    elif suffix == SPIDER_SUFFIX:
+        yield from _spider_pages(data, _label(parts, label), name)
+
+
+def _extract(page: tuple) -> tuple:
+    # 与 Shield 原先的 _process_data 相同：整页所有开始标签名以空格连接
+    kind, value, label = page
+    if kind == "path":
+        with open(value, "rb") as f:
+            value = f.read()
+    return " ".join(extract_tags(_decode(value), limit=None)), label
+
+
+def _check_output(output: str, force: bool) -> None:
+    # 输出目录会被整个替换，不能误删其他数据
+    if force or not os.path.exists(output):
+        return
+    if not os.path.isdir(output):
+        raise ValueError(f"输出路径不是目录: {output}")
+    if not os.listdir(output):
+        return
+    try:
+        with open(os.path.join(output, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if not isinstance(manifest, dict) or "shards" not in manifest:
+        raise ValueError(f"输出目录不为空且不是生成的语料，使用 --force 覆盖: {output}")
+
+
+def build_corpus(
+    sources: list,
+    output: str,
+    label: int = None,
+    workers: int = CORPUS_WORKERS,
+    shard_lines: int = CORPUS_SHARD_LINES,
+    seed: int = 0,
+    force: bool = False,
+) -> dict:
+    """把 sources 中的网页转换为训练数据分片写入 output 目录，返回统计信息
+
+    标签序列相同的网页只保留第一个；同一序列有不同标签时也只保留第一个，计入 conflicts。
+    output 已存在且不为空时，只有其中有之前生成的 manifest.json 或 force 为真才替换
+    """
+    _check_output(output, force)
+    workers = workers or os.cpu_count() or 1
+    start = time.time()
+    stats = Counter()
+    lines = {}  # 标签序列 -> 标签，保持第一次出现的顺序
+    unlabelled = invalid = 0
+
+    def labelled():
+        nonlocal unlabelled, invalid
+        for source in sources:
+            for page in _pages(source, label):
+                if page[0] == "invalid":
+                    invalid += 1
+                elif page[2] is None:
+                    unlabelled += 1
+                else:
+                    yield page
+
+    pages = labelled()
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(_extract, pages, chunksize=16)
+    else:
+        pool = None
+        results = map(_extract, pages)
+    try:
+        for tags, page_label in results:
+            stats["pages"] += 1
+            if not tags:
+                stats["empty"] += 1
+            elif tags not in lines:
+                lines[tags] = page_label
+            else:
+                stats["duplicates"] += 1
+                stats["conflicts"] += lines[tags] != page_label
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # Trainer 按顺序划分训练、验证和测试集，打乱后各部分的标签分布才一致
+    items = list(lines.items())
+    random.Random(seed).shuffle(items)
+    tmp = f"{output.rstrip(os.sep)}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        for shard, begin in enumerate(range(0, len(items), shard_lines)):
+            name = SHARD_PATTERN.replace("*", f"{shard:05d}")
+            with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                for tags, page_label in items[begin : begin + shard_lines]:
+                    f.write(f"{tags}\t{page_label}\n")
+        manifest = {
+            "sources": [os.path.abspath(source) for source in sources],
+            "pages": stats["pages"],
+            "lines": len(items),
+            "labels": dict(Counter(str(value) for value in lines.values())),
+            "duplicates": stats["duplicates"],
+            "conflicts": stats["conflicts"],
+            "empty": stats["empty"],
+            "unlabelled": unlabelled,
+            "invalid": invalid,
+            "shards": -(-len(items) // shard_lines),
+            "seconds": round(time.time() - start, 3),
+        }
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    shutil.rmtree(output, ignore_errors=True)
+    os.replace(tmp, output)
+    return manifest
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="由标注好的网页生成 Shield 训练数据")
+    parser.add_argument(
+        "sources", nargs="+", help="网页目录、zip/tar 压缩包或 spider 结果 JSON"
+    )
+    parser.add_argument("--output", default="data/corpus", help="分片输出目录")
+    parser.add_argument(
+        "--label",
+        choices=sorted(LABEL_DIRS),
+        help="所有网页的标签，不指定时取自上级目录名",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=CORPUS_WORKERS, help="进程数，0 表示 CPU 核数"
+    )
+    parser.add_argument(
+        "--shard-lines", type=int, default=CORPUS_SHARD_LINES, help="每个分片的行数"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="打乱顺序的随机种子")
+    parser.add_argument(
+        "--force", action="store_true", help="输出目录不是之前生成的语料时也替换"
+    )
+    args = parser.parse_args(argv)
+    label = LABEL_DIRS[args.label] if args.label is not None else None
+
+    try:
+        manifest = build_corpus(
+            args.sources,
+            args.output,
+            label,
+            args.workers,
+            args.shard_lines,
+            args.seed,
+            args.force,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print(json.dumps(manifest, ensure_ascii=False, indent=2))
+    if manifest["unlabelled"]:
+        print(f"{manifest['unlabelled']} 个网页无法确定标签，已跳过")
+    if manifest["invalid"]:
+        print(f"{manifest['invalid']} 个 .json 文件不是 spider 的结果，已跳过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+import numpy as np
+from tqdm import tqdm
+from transformers import BertTokenizer
+from config.config import *
+from shield.cache import weights_version
+from shield.tokens import TagTokenizer
+
+FORMAT_VERSION = 1  # 缓存格式或分词方式改变时加一，旧的缓存自动失效
+CHUNK_LINES = 10_000  # 每个分词任务的行数
+BUCKET_BATCHES = 50  # 每个长度桶包含的批数，越大补齐越少、批的随机性越小
+SHARD_PATTERN = "part-*.txt"  # 数据目录中的分片文件，由 shield.corpus 生成
+
+_tokenizer = None  # 分词进程中的 TagTokenizer
+
+
+def _init_worker() -> None:
+    global _tokenizer
+    _tokenizer = TagTokenizer(BertTokenizer.from_pretrained(BERT_PATH))
+
+
+def _encode(lines: list) -> tuple:
+    # 截断但不补齐，只保存实际的 WordPiece 编号和长度
+    ids, lengths, labels = [], [], []
+    for line in lines:
+        tags, label = line.strip().split("\t")
+        encoded = _tokenizer.encode(tags)
+        ids.extend(encoded)
+        lengths.append(len(encoded))
+        labels.append(int(label))
+    return (
+        np.array(ids, np.uint16),
+        np.array(lengths, np.uint16),
+        np.array(labels, np.int8),
+    )
+
+
+def data_files(path: str = DATA_PATH) -> list:
+    """标注数据文件；path 为目录时是其中按文件名排序的各个分片"""
+    if not os.path.isdir(path):
+        return [path]
+    files = sorted(glob.glob(os.path.join(path, SHARD_PATTERN)))
+    if not files:
+        raise FileNotFoundError(f"数据目录中没有分片文件: {path}")
+    return files
+
+
+def data_lines(path: str = DATA_PATH):
+    """依次读出所有数据文件的行，不把整个数据集读入内存"""
+    for filename in data_files(path):
+        with open(filename, encoding="utf-8") as f:
+            yield from f
+
+
+def data_version(path: str = DATA_PATH) -> str:
+    """数据文件的哈希；目录的哈希由各分片的文件名和哈希共同决定"""
+    if not os.path.isdir(path):
+        return weights_version(path)
+    digest = hashlib.blake2b(digest_size=16)
+    for filename in data_files(path):
+        digest.update(os.path.basename(filename).encode("utf-8"))
+        digest.update(weights_version(filename).encode("ascii"))
+    return digest.hexdigest()
+
+
+def _chunks(path: str):
+    chunk = []
+    for line in data_lines(path):
+        chunk.append(line)
+        if len(chunk) == CHUNK_LINES:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def tokenizer_version() -> str:
+    """词表、截断长度和缓存格式共同决定分词结果"""
+    vocab = os.path.join(BERT_PATH, "vocab.txt")
+    return weights_version(vocab, f"{FORMAT_VERSION}:{MAX_LEN}")
+
+
+def build_dataset(
+    data_path: str = DATA_PATH,
+    cache_dir: str = DATASET_CACHE_DIR,
+    workers: int = DATASET_WORKERS,
+) -> str:
+    """把标注数据分词后写入缓存目录，返回数据集目录；数据和分词器都没变时直接返回
+
+    data_path 为数据文件或 shield.corpus 生成的分片目录，分片按文件名顺序依次读取；
+    缓存目录中 ids.u16 为所有网页的 WordPiece 编号依次相连，lengths.u16 为各网页的长度，
+    labels.i8 为标签，manifest.json 记录数据文件哈希和分词器版本
+    """
+    manifest = {
+        "data": data_version(data_path),
+        "tokenizer": tokenizer_version(),
+        "max_len": MAX_LEN,
+    }
+    path = os.path.join(
+        cache_dir, f"{manifest['data'][:16]}-{manifest['tokenizer'][:16]}"
+    )
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            cached = json.load(f)
+        if all(cached.get(k) == v for k, v in manifest.items()):
+            return path
+    except (OSError, ValueError):
+        pass
+
+    tokenizer = BertTokenizer.from_pretrained(BERT_PATH)
+    if len(tokenizer) > 1 << 16:
+        raise ValueError(f"词表大小 {len(tokenizer)} 超出 uint16 的范围")
+    manifest["pad"] = tokenizer.pad_token_id
+    workers = workers or os.cpu_count() or 1
+    start = time.time()
+    # 先写入临时目录，完成后再改名，中断时不会留下不完整的缓存
+    tmp = f"{path}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    count = tokens = 0
+    try:
+        with open(os.path.join(tmp, "ids.u16"), "wb") as ids_file, open(
+            os.path.join(tmp, "lengths.u16"), "wb"
+        ) as lengths_file, open(os.path.join(tmp, "labels.i8"), "wb") as labels_file:
+            if workers > 1:
+                pool = multiprocessing.Pool(workers, initializer=_init_worker)
+                results = pool.imap(_encode, _chunks(data_path))
+            else:
+                pool = None
+                _init_worker()
+                results = map(_encode, _chunks(data_path))
+            try:
+                for ids, lengths, labels in tqdm(results, desc="分词", unit="块"):
+                    ids.tofile(ids_file)
+                    lengths.tofile(lengths_file)
+                    labels.tofile(labels_file)
+                    count += len(labels)
+                    tokens += len(ids)
+            finally:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    manifest.update(
+        count=count,
+        tokens=tokens,
+        format=FORMAT_VERSION,
+        seconds=round(time.time() - start, 3),
+    )
+    with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    return path
+
+
+class TokenizedDataset:
+    """build_dataset 生成的数据集，数组以内存映射方式打开"""
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.pad = self.manifest["pad"]
+        self.ids = self._open(path, "ids.u16", np.uint16)
+        self.lengths = self._open(path, "lengths.u16", np.uint16)
+        self.labels = self._open(path, "labels.i8", np.int8)
+        self.offsets = np.zeros(len(self.lengths) + 1, np.int64)
+        np.cumsum(self.lengths, dtype=np.int64, out=self.offsets[1:])
+
+    @staticmethod
+    def _open(path: str, name: str, dtype):
+        filename = os.path.join(path, name)
+        # 空文件不能内存映射
+        if os.path.getsize(filename) == 0:
+            return np.zeros(0, dtype)
+        return np.memmap(filename, dtype, "r")
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def padded(self, indices) -> tuple:
+        """indices 所指的网页补齐到其中最长的序列，返回 int64 的
+        (input_ids, attention_mask, token_type_ids, labels)；只按批生成，不补齐整个数据集
+        """
+        indices = np.asarray(indices, np.int64)
+        lengths = self.lengths[indices].astype(np.int64)
+        width = int(lengths.max()) if len(lengths) else 0
+        masks = np.arange(width) < lengths[:, None]
+        ids = np.full(masks.shape, self.pad, np.int64)
+        for row, index in enumerate(indices):
+            ids[row, : lengths[row]] = self.ids[
+                self.offsets[index] : self.offsets[index + 1]
+            ]
+        labels = self.labels[indices].astype(np.int64)
+        return ids, masks.astype(np.int64), np.zeros_like(ids), labels
+
+
+def load_dataset(
+    data_path: str = DATA_PATH, cache_dir: str = DATASET_CACHE_DIR
+) -> TokenizedDataset:
+    """打开分词后的数据集，缓存不存在或已过期时先生成"""
+    return TokenizedDataset(build_dataset(data_path, cache_dir))
+
+
+class LengthBucketSampler:
+    """按长度分桶的批采样器，用作 DataLoader 的 batch_sampler
+
+    打乱后每 batch_size × BUCKET_BATCHES 个网页为一桶，桶内按长度排序后切成批，
+    最后打乱批的顺序；同一批的序列长度相近，只需补齐到批内最长的序列
+    """
+
+    def __init__(
+        self, lengths, batch_size: int, shuffle: bool = True, seed: int = None
+    ) -> None:
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self._rng = np.random.default_rng(seed)
+
+    def __iter__(self):
+        n = len(self.lengths)
+        order = self._rng.permutation(n) if self.shuffle else np.arange(n)
+        size = self.batch_size * BUCKET_BATCHES
+        batches = []
+        for start in range(0, n, size):
+            bucket = order[start : start + size]
+            bucket = bucket[np.argsort(self.lengths[bucket], kind="stable")]
+            for i in range(0, len(bucket), self.batch_size):
+                batches.append(bucket[i : i + self.batch_size].tolist())
+        if self.shuffle:
+            self._rng.shuffle(batches)
+        return iter(batches)
+
+    def __len__(self) -> int:
+        size = self.batch_size * BUCKET_BATCHES
+        full, rest = divmod(len(self.lengths), size)
+        return full * BUCKET_BATCHES + -(-rest // self.batch_size)
@@ -0,0 +1,164 @@
+import threading
+from array import array
+import numpy as np
+from config.config import *
+
+SHINGLE = 3  # 连续几个 WordPiece 作为一个特征
+BUCKET_LIMIT = 256  # 每个桶最多保留的条目数，同一模板的大量页面不会让查找变慢
+
+
+def _mix(x):
+    # splitmix64 的混合函数，把特征散列到 64 位
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _popcount(x) -> np.ndarray:
+    return np.unpackbits(x.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+def simhash(input_ids) -> int:
+    """WordPiece 序列的 64 位 SimHash，特征为连续 SHINGLE 个编号"""
+    ids = np.asarray(input_ids, dtype=np.uint64)
+    width = min(SHINGLE, len(ids))
+    count = len(ids) - width + 1
+    with np.errstate(over="ignore"):
+        hashes = np.zeros(count, np.uint64)
+        for j in range(width):
+            hashes = _mix(hashes ^ ids[j : j + count])
+    bits = np.unpackbits(hashes.view(np.uint8)).reshape(count, 64)
+    votes = bits.sum(axis=0) * 2 > count
+    return int(np.packbits(votes).view(np.uint64)[0])
+
+
+class NeighbourIndex:
+    """SimHash 近似重复索引：汉明距离不超过 distance 的网页复用已有的高置信度判定
+
+    指纹分成 distance + 1 段，距离不超过 distance 的两个指纹至少有一段完全相同，
+    因此只需比较各段所在桶中的候选；条目保存在定长数组中，写满后覆盖最早的条目
+    """
+
+    def __init__(
+        self,
+        distance: int = SHIELD_NEIGHBOUR_DISTANCE,
+        confidence: float = SHIELD_NEIGHBOUR_CONFIDENCE,
+        size: int = SHIELD_NEIGHBOUR_SIZE,
+    ) -> None:
+        if not 0 <= distance < 64:
+            raise ValueError(f"汉明距离应在 0 到 63 之间: {distance}")
+        self.distance = distance
+        self.confidence = confidence
+        self.size = size
+        bands = distance + 1
+        bounds = [64 * i // bands for i in range(bands + 1)]
+        self._bands = [
+            (start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])
+        ]
+        self._tables = [{} for _ in self._bands]
+        self._fingerprints = np.zeros(size, np.uint64)
+        self._labels = np.zeros(size, np.int8)
+        self._probabilities = np.zeros(size, np.float32)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._distances = [0] * (distance + 1)  # 命中时的距离分布
+
+    def _buckets(self, fingerprint: int):
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            yield table, (fingerprint >> shift) & mask
+
+    def find(self, fingerprint: int):
+        """最近的邻居的 (标签编号, 概率, 距离)，没有时返回 None"""
+        with self._lock:
+            self._lookups += 1
+            candidates = set()
+            for table, band in self._buckets(fingerprint):
+                bucket = table.get(band)
+                if bucket is not None:
+                    candidates.update(bucket)
+            if not candidates:
+                return None
+            slots = np.fromiter(candidates, np.int64, len(candidates))
+            distances = _popcount(self._fingerprints[slots] ^ np.uint64(fingerprint))
+            best = int(distances.argmin())
+            distance = int(distances[best])
+            if distance > self.distance:
+                return None
+            self._distances[distance] += 1
+            slot = slots[best]
+            return int(self._labels[slot]), float(self._probabilities[slot]), distance
+
+    def add(self, fingerprint: int, label: int, probability: float) -> bool:
+        """置信度足够时加入索引"""
+        if self.size <= 0 or probability < self.confidence:
+            return False
+        with self._lock:
+            slot = self._count % self.size
+            if self._count >= self.size:
+                # 覆盖最早的条目，先从桶中移除
+                old = int(self._fingerprints[slot])
+                for table, band in self._buckets(old):
+                    bucket = table.get(band)
+                    if bucket is not None and slot in bucket:
+                        bucket.remove(slot)
+            self._fingerprints[slot] = fingerprint
+            self._labels[slot] = label
+            self._probabilities[slot] = probability
+            for table, band in self._buckets(fingerprint):
+                bucket = table.setdefault(band, array("I"))
+                if len(bucket) < BUCKET_LIMIT:
+                    bucket.append(slot)
+            self._count += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = sum(self._distances)
+            return {
+                "lookups": self._lookups,
+                "hits": hits,  # 即节省的模型推理次数
+                "hit_rate": hits / self._lookups if self._lookups else 0,
+                "distances": list(self._distances),
+                "entries": min(self._count, self.size),
+                "distance": self.distance,
+                "confidence": self.confidence,
+            }
+
+
+def neighbour_report(
+    fingerprints: list,
+    labels: list,
+    bert_pred: list,
+    bert_prob: list,
+    distance: int = SHIELD_NEIGHBOUR_DISTANCE,
+    confidence: float = SHIELD_NEIGHBOUR_CONFIDENCE,
+) -> dict:
+    """按顺序模拟服务中的复用：命中时复用邻居的判定，否则记下 BERT 的判定，
+    统计复用的比例、复用的判定与该网页自己的 BERT 判定的一致性和准确率"""
+    index = NeighbourIndex(distance, confidence, max(1, len(labels)))
+    final, reused = [], []
+    for fingerprint, label, pred, prob in zip(
+        fingerprints, labels, bert_pred, bert_prob
+    ):
+        neighbour = index.find(fingerprint)
+        if neighbour is None:
+            index.add(fingerprint, pred, prob)
+            final.append(pred)
+        else:
+            final.append(neighbour[0])
+            reused.append((neighbour[0], pred, label))
+    pages = len(labels)
+    return {
+        "pages": pages,
+        "reused": len(reused),
+        "reuse_rate": len(reused) / pages if pages else 0.0,
+        "agreement": (
+            sum(a == b for a, b, _ in reused) / len(reused) if reused else 1.0
+        ),
+        "reuse_accuracy": (
+            sum(a == c for a, _, c in reused) / len(reused) if reused else 1.0
+        ),
+        "bert_accuracy": sum(a == b for a, b in zip(labels, bert_pred)) / pages,
+        "accuracy": sum(a == b for a, b in zip(labels, final)) / pages,
+    }
@@ -0,0 +1,126 @@
+import gc
+import itertools
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import Future, TimeoutError
+from config.config import *
+
+
+def _serve(backend, threads: int, tasks, results) -> None:
+    # 子进程：逐个取出前向计算任务，结果连同进程号放回结果队列
+    backend = backend.fork(threads)
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, inputs = task
+        try:
+            results.put((task_id, os.getpid(), backend(*inputs), None))
+        except Exception as e:  # 异常不一定能序列化，只传回描述
+            results.put((task_id, os.getpid(), None, repr(e)))
+
+
+class WorkerPool:
+    """预先 fork 的推理进程池，用法与其他推理后端相同
+
+    父进程加载模型后再 fork，各进程以写时复制的方式共享权重内存；
+    前向计算通过本机队列交给空闲的进程，每个进程使用 threads 个线程，
+    进程数 × 线程数不超过 CPU 核数
+    """
+
+    def __init__(
+        self,
+        backend,
+        workers: int = SHIELD_WORKERS,
+        threads: int = SHIELD_WORKER_THREADS,
+    ) -> None:
+        if workers <= 0:
+            raise ValueError(f"推理进程数应大于 0: {workers}")
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        context = multiprocessing.get_context("fork")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._pending = {}  # 任务编号 -> Future
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._done = Counter()  # 进程号 -> 完成的批数
+        # 父进程已有的对象不再参与垃圾回收，子进程回收时不会写入（复制）这些内存页
+        gc.freeze()
+        self._processes = [
+            context.Process(
+                target=_serve,
+                args=(backend, self.threads, self._tasks, self._results),
+                name=f"shield-worker-{i}",
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        for process in self._processes:
+            process.start()
+        self._reader = threading.Thread(
+            target=self._read, name="shield-pool-reader", daemon=True
+        )
+        self._reader.start()
+
+    def _read(self) -> None:
+        while True:
+            item = self._results.get()
+            if item is None:
+                return
+            task_id, pid, logits, error = item
+            with self._lock:
+                # __call__ 放弃等待（推理进程退出）后结果仍可能到达，此时已没有人等待
+                future = self._pending.pop(task_id, None)
+                self._done[pid] += 1
+            if future is None:
+                continue
+            if error is None:
+                future.set_result(logits)
+            else:
+                future.set_exception(RuntimeError(f"推理进程出错: {error}"))
+
+    def _check(self) -> None:
+        dead = [p.name for p in self._processes if not p.is_alive()]
+        if dead:
+            raise RuntimeError(f"推理进程已退出: {', '.join(dead)}")
+
+    def __call__(self, input_ids, attention_mask, token_type_ids):
+        self._check()
+        future = Future()
+        with self._lock:
+            task_id = next(self._ids)
+            self._pending[task_id] = future
+        self._tasks.put((task_id, (input_ids, attention_mask, token_type_ids)))
+        while True:
+            try:
+                return future.result(timeout=1)
+            except TimeoutError:
+                # 进程被杀死（如内存不足）时任务不会再有结果
+                try:
+                    self._check()
+                except RuntimeError:
+                    with self._lock:
+                        self._pending.pop(task_id, None)
+                    raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "threads": self.threads,
+                "alive": sum(p.is_alive() for p in self._processes),
+                "in_flight": len(self._pending),
+                "batches": [self._done[p.pid] for p in self._processes],
+            }
+
+    def close(self) -> None:
+        """处理完已分发的任务后结束所有推理进程"""
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join()
+        self._results.put(None)
+        self._reader.join()
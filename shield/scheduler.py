@@ -0,0 +1,125 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from config.config import *
+
+
+class BatchScheduler:
+    """把并发的 Shield 请求合并成批，由后台线程逐批执行前向计算
+
+    第一个请求到达后最多再等 max_wait 秒，或凑满 max_batch_size 个即开始计算；
+    各请求线程只等待自己的结果，不再各自占用 CPU 做单条推理。
+    使用推理进程池时由 concurrency 个后台线程同时凑批，每个进程各算一批
+    """
+
+    def __init__(
+        self,
+        shield,
+        max_batch_size: int = SHIELD_BATCH_SIZE,
+        max_wait: float = SHIELD_MAX_WAIT,
+        concurrency: int = None,
+    ) -> None:
+        if concurrency is None:
+            # 与该 Shield 实际使用的推理进程数一致，而不是全局的 SHIELD_WORKERS
+            concurrency = max(1, shield.workers or 0)
+        self.shield = shield
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._batches = Counter()  # 批大小 -> 次数
+        self._waited = 0.0
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._loop, name="shield-scheduler", daemon=True)
+            for _ in range(concurrency)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, html: str) -> Future:
+        """提交一个网页，返回的 Future 结果为 {"label": 标签, "probability": 概率}"""
+        if self._closed:
+            raise RuntimeError("调度器已关闭")
+        future = Future()
+        self._queue.put((html, future, time.monotonic()))
+        return future
+
+    def predict_batch(self, htmls) -> list:
+        futures = [self.submit(html) for html in htmls]
+        return [future.result() for future in futures]
+
+    def __call__(self, html: str) -> str:
+        return self.submit(html).result()["label"]
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                # 超时后仍取走已经排队的请求，不让它们再等一轮
+                item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is None:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            batch = [item for item in batch if item is not None]
+            if batch:
+                self._run(batch)
+            if stop:
+                return
+
+    def _run(self, batch: list) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._requests += len(batch)
+            self._batches[len(batch)] += 1
+            self._waited += sum(now - queued for _, _, queued in batch)
+        try:
+            results = self.shield.predict_batch(
+                [html for html, _, _ in batch], batch_size=len(batch)
+            )
+        except Exception as e:
+            logging.error(f"Shield 批量推理出错: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            batches = sum(self._batches.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": batches,
+                "mean_batch_size": self._requests / batches if batches else 0,
+                "max_batch_size": max(self._batches, default=0),
+                "batch_sizes": dict(sorted(self._batches.items())),
+                "mean_wait_ms": (
+                    1000 * self._waited / self._requests if self._requests else 0
+                ),
+            }
+
+    def close(self) -> None:
+        """处理完已排队的请求后停止后台线程"""
+        if not self._closed:
+            self._closed = True
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
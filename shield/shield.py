@@ -1,4 +1,3 @@
-from tqdm import tqdm
 from sklearn.metrics import accuracy_score, classification_report
 from transformers import (
     BertModel,
@@ -6,23 +5,51 @@ from transformers import (
     BertConfig,
     get_cosine_schedule_with_warmup,
 )
-from torch.optim import AdamW
-from torch.utils.data import TensorDataset, DataLoader, RandomSampler
-import torch.nn as nn
-import torch
+
+try:
+    from torch.optim import AdamW
+    from torch.utils.data import DataLoader, RandomSampler
+    import torch.nn as nn
+    import torch
+except ImportError:  # 只用 ONNX 后端推理时可以不安装 PyTorch
+    torch = nn = None
+try:
+    from safetensors.torch import load_file, save_file
+except ImportError:  # 缺少时加载 PyTorch 模型会报错，见 _require_torch
+    load_file = save_file = None
+import functools
+import numpy as np
 import time
+import os
+import threading
+from collections import Counter
 from config.config import *
-from bs4 import BeautifulSoup
+from shield.backend import OnnxBackend, TorchBackend, export_onnx, replacing
+from shield.tags import extract_tags
+from shield.tokens import TagTokenizer
+from shield.cache import VerdictCache, file_version
+from shield.neighbours import NeighbourIndex, neighbour_report, simhash
+from shield.pool import WorkerPool
+from shield.cascade import CascadeModel, cascade_report
+from shield.dataset import LengthBucketSampler, data_lines, load_dataset
 
 # DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu") # 如果CUDA可用，则使用CUDA，否则使用CPU
-DEVICE = torch.device("cpu")
+DEVICE = torch.device("cpu") if torch is not None else None
 
 
-class Bert_Model(nn.Module):
-    def __init__(self, bert_path, classes=2):
+class Bert_Model(nn.Module if nn is not None else object):
+    def __init__(self, bert_path, classes=2, pretrained=True, layers=None):
         super(Bert_Model, self).__init__()
         self.config = BertConfig.from_pretrained(bert_path)  # 导入模型超参数
-        self.bert = BertModel.from_pretrained(bert_path)  # 加载预训练模型权重
+        if layers:
+            self.config.num_hidden_layers = layers  # 蒸馏的学生模型只有部分编码器层
+        if pretrained:
+            self.bert = BertModel.from_pretrained(
+                bert_path, config=self.config
+            )  # 加载预训练模型权重
+        else:
+            # 随后加载微调后的权重，只按 config.json 搭建结构，不读取预训练权重
+            self.bert = BertModel(self.config)
         self.fc = nn.Linear(self.config.hidden_size, classes)  # 直接分类
 
     def forward(self, input_ids, attention_mask=None, token_type_ids=None):
@@ -32,6 +59,128 @@ class Bert_Model(nn.Module):
         return logit
 
 
+def _outdated(path, source):
+    # 生成的文件不存在或早于源文件（模型重新训练过）
+    return not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source)
+
+
+def _derived_path(model_path, path, suffix):
+    # 学生模型量化、导出的文件与教师模型的分开存放
+    if model_path == MODEL_PATH:
+        return path
+    return os.path.splitext(model_path)[0] + suffix
+
+
+def _num_layers(state):
+    # 由权重推断编码器层数，学生模型的层数较少
+    prefix = "bert.encoder.layer."
+    return len({k[len(prefix) :].split(".")[0] for k in state if k.startswith(prefix)})
+
+
+def _collate(dataset, indices):
+    # DataLoader 的 collate_fn：样本是网页编号，从内存映射的数组中取出并补齐到批内最长的序列
+    return tuple(map(torch.as_tensor, dataset.padded(indices)))
+
+
+def _safetensors_path(model_path):
+    return os.path.splitext(model_path)[0] + ".safetensors"
+
+
+def _require_torch():
+    # 缺少依赖时明确指出需要安装的包，而不是在之后出现 NameError
+    missing = [
+        name
+        for name, module in (("torch", torch), ("safetensors", load_file))
+        if module is None
+    ]
+    if missing:
+        raise ImportError(f"加载 PyTorch 模型需要安装 {', '.join(missing)}")
+
+
+def _weights(model_path=MODEL_PATH, device="cpu"):
+    """微调后的权重，第一次使用时转换为同名的 .safetensors 文件，之后直接内存映射读取"""
+    _require_torch()
+    path = _safetensors_path(model_path)
+    if os.path.exists(model_path) and _outdated(path, model_path):
+        state = torch.load(model_path, map_location="cpu")
+        with replacing(path) as tmp:
+            save_file({k: v.contiguous() for k, v in state.items()}, tmp)
+    return load_file(path, device=str(device))
+
+
+def _load_state(model, state):
+    """加载微调后的权重：忽略多余的键（如旧版 transformers 保存的 position_ids），
+    缺少键时报错，否则这部分参数会悄悄保持随机初始化"""
+    keys = model.load_state_dict(state, strict=False)
+    if keys.missing_keys:
+        missing = ", ".join(keys.missing_keys[:5])
+        raise ValueError(f"模型权重缺少 {len(keys.missing_keys)} 个参数: {missing}")
+    return model
+
+
+def _quantize(model):
+    # 只量化 Linear 层，权重转为 INT8，激活值在运行时动态量化
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_model(model_path=MODEL_PATH, output_path=QUANTIZED_MODEL_PATH):
+    """把训练好的模型动态量化为 INT8 并保存，用于 CPU 推理"""
+    state = _weights(model_path)
+    model = Bert_Model(BERT_PATH, pretrained=False, layers=_num_layers(state))
+    _load_state(model, state)
+    model.eval()
+    quantized = _quantize(model)
+    with replacing(output_path) as tmp:
+        torch.save(quantized.state_dict(), tmp)
+    return quantized
+
+
+def load_quantized_model(path=QUANTIZED_MODEL_PATH):
+    state = torch.load(path, map_location="cpu")
+    layers = _num_layers(state)
+    model = _quantize(Bert_Model(BERT_PATH, pretrained=False, layers=layers).eval())
+    model.load_state_dict(state)
+    model.eval()
+    return model
+
+
+def _load_model(quantized=False, model_path=MODEL_PATH):
+    _require_torch()
+    if quantized:
+        # 量化模型只能在 CPU 上运行，模型重新训练后自动重新量化
+        path = _derived_path(model_path, QUANTIZED_MODEL_PATH, ".int8.pth")
+        # 部署时可能只有转换后的 .safetensors
+        source = model_path
+        if not os.path.exists(source):
+            source = _safetensors_path(model_path)
+        if _outdated(path, source):
+            quantize_model(model_path, path)
+        return load_quantized_model(path)
+    state = _weights(model_path, DEVICE)
+    model = Bert_Model(BERT_PATH, pretrained=False, layers=_num_layers(state))
+    _load_state(model.to(DEVICE), state)
+    model.eval()
+    return model
+
+
+def _student(teacher, layers=STUDENT_LAYERS):
+    """从教师模型中均匀选取 layers 个编码器层，连同嵌入层和分类层初始化学生模型"""
+    total = teacher.config.num_hidden_layers
+    picks = [round(i * (total - 1) / max(1, layers - 1)) for i in range(layers)]
+    prefix = "bert.encoder.layer."
+    state = {}
+    for key, value in teacher.state_dict().items():
+        if key.startswith(prefix):
+            index, rest = key[len(prefix) :].split(".", 1)
+            if int(index) not in picks:
+                continue
+            key = f"{prefix}{picks.index(int(index))}.{rest}"
+        state[key] = value
+    student = Bert_Model(BERT_PATH, pretrained=False, layers=layers)
+    student.load_state_dict(state)
+    return student
+
+
 class Trainer:
     def __init__(self) -> None:
         # 初始化必须组件
@@ -43,13 +192,7 @@ class Trainer:
     def train(self):
         # 初始化Bert模型
         model = Bert_Model(BERT_PATH).to(DEVICE)
-        # 初始化相关功能函数:
-        optimizer = AdamW(model.parameters(), lr=2e-5, weight_decay=1e-4)  # AdamW优化器
-        scheduler = get_cosine_schedule_with_warmup(
-            optimizer,
-            num_warmup_steps=len(self.train_loader),
-            num_training_steps=EPOCHS * len(self.train_loader),
-        )  # 用一个EPOCH进行warmp帮助收敛
+        optimizer, scheduler = self._optimizer(model)
         self._train_and_eval(
             model,
             self.train_loader,
@@ -60,44 +203,102 @@ class Trainer:
             EPOCHS,
         )
 
+    # 知识蒸馏：以微调后的 Bert_Model 为教师，训练编码器层数较少的学生模型
+    def distill(self, layers=STUDENT_LAYERS):
+        teacher = _load_model()
+        student = _student(teacher, layers).to(DEVICE)
+        optimizer, scheduler = self._optimizer(student)
+        self._train_and_eval(
+            student,
+            self.train_loader,
+            self.valid_loader,
+            optimizer,
+            scheduler,
+            DEVICE,
+            EPOCHS,
+            teacher=teacher,
+            path=STUDENT_MODEL_PATH,
+        )
+
+    def _optimizer(self, model):
+        # 初始化相关功能函数:
+        optimizer = AdamW(model.parameters(), lr=2e-5, weight_decay=1e-4)  # AdamW优化器
+        steps = -(-len(self.train_loader) // GRAD_ACCUM_STEPS)  # 每个周期的参数更新次数
+        scheduler = get_cosine_schedule_with_warmup(
+            optimizer,
+            num_warmup_steps=steps,
+            num_training_steps=EPOCHS * steps,
+        )  # 用一个EPOCH进行warmp帮助收敛
+        return optimizer, scheduler
+
     def _load_data(self):
-        input_ids, input_masks, input_types, tag_labels = [], [], [], []
-        with open(DATA_PATH, encoding="utf-8") as f:
-            for line in tqdm(f):
-                tags, labels = line.strip().split("\t")
-                encode_dict = self.tokenizer.encode_plus(
-                    text=tags, max_length=MAX_LEN, padding="max_length", truncation=True
-                )
-                input_ids.append(encode_dict["input_ids"])
-                input_types.append(encode_dict["token_type_ids"])
-                input_masks.append(encode_dict["attention_mask"])
-                tag_labels.append(int(labels))
+        # 分词结果缓存在 DATASET_CACHE_DIR，数据文件和词表不变时直接内存映射读取
+        # 训练、验证、测试集是网页编号的区间，每批的张量由 _collate 按需补齐
+        dataset = load_dataset()
+        unit = len(dataset) // 10
+        splits = (
+            range(unit * 8),
+            range(unit * 8, unit * 9),
+            range(unit * 9, len(dataset)),
+        )
+        return dataset, splits
 
-        all_data = (input_ids, input_masks, input_types, tag_labels)
+    def _load_tags(self):
+        # 原始标签序列按与 _load_data 相同的方式划分，供级联的轻量模型使用
+        tag_lines, tag_labels = [], []
+        for line in data_lines(DATA_PATH):
+            tags, labels = line.strip().split("\t")
+            tag_lines.append(tags)
+            tag_labels.append(int(labels))
         unit = len(tag_labels) // 10
-        train_data = list(map(lambda x: x[: unit * 8], all_data))
-        valid_data = list(map(lambda x: x[unit * 8 : unit * 9], all_data))
-        test_data = list(map(lambda x: x[unit * 9 :], all_data))
-        return train_data, valid_data, test_data
+        return [
+            (tag_lines[start:end], tag_labels[start:end])
+            for start, end in ((0, unit * 8), (unit * 8, unit * 9), (unit * 9, None))
+        ]
 
     def _create_dataloader(self):
-        train_data, valid_data, test_data = self._load_data()
-        train_dataset = TensorDataset(*tuple(map(torch.LongTensor, train_data)))
-        train_sampler = RandomSampler(train_dataset)
+        self.dataset, (train_split, valid_split, test_split) = self._load_data()
+        self.test_split = test_split  # 按原顺序保留，与 _load_tags() 的测试集一一对应
+        collate = functools.partial(_collate, self.dataset)
+        if TRAIN_BUCKETING:
+            # 长度相近的网页组成一批，补齐的位置更少
+            self.train_loader, self.valid_loader, self.test_loader = (
+                DataLoader(
+                    split,
+                    batch_sampler=LengthBucketSampler(
+                        self.dataset.lengths[split.start : split.stop],
+                        BATCH_SIZE,
+                        shuffle=shuffle,
+                    ),
+                    collate_fn=collate,
+                )
+                for split, shuffle in (
+                    (train_split, True),
+                    (valid_split, False),
+                    (test_split, False),
+                )
+            )
+            return
+
+        train_sampler = RandomSampler(train_split)
         self.train_loader = DataLoader(
-            train_dataset, sampler=train_sampler, batch_size=BATCH_SIZE
+            train_split,
+            sampler=train_sampler,
+            batch_size=BATCH_SIZE,
+            collate_fn=collate,
         )
 
-        valid_dataset = TensorDataset(*tuple(map(torch.LongTensor, valid_data)))
-        valid_sampler = RandomSampler(valid_dataset)
+        valid_sampler = RandomSampler(valid_split)
         self.valid_loader = DataLoader(
-            valid_dataset, sampler=valid_sampler, batch_size=BATCH_SIZE
+            valid_split,
+            sampler=valid_sampler,
+            batch_size=BATCH_SIZE,
+            collate_fn=collate,
         )
 
-        test_dataset = TensorDataset(*tuple(map(torch.LongTensor, test_data)))
-        test_sampler = RandomSampler(test_dataset)
+        test_sampler = RandomSampler(test_split)
         self.test_loader = DataLoader(
-            test_dataset, sampler=test_sampler, batch_size=BATCH_SIZE
+            test_split, sampler=test_sampler, batch_size=BATCH_SIZE, collate_fn=collate
         )
 
     # 评估函数
@@ -118,9 +319,7 @@ class Trainer:
     def _predict(self):
         data_loader = self.test_loader
         device = DEVICE
-        model = Bert_Model(BERT_PATH).to(DEVICE)
-        model.load_state_dict(torch.load("best_bert_model.pth"))
-        model.eval()
+        model = _load_model()
         label_true, label_pred = [], []
         with torch.no_grad():
             for ids, att, tpe, label in data_loader:
@@ -133,19 +332,244 @@ class Trainer:
         print("\n 测试准确率 = {} \n".format(accuracy_score(label_true, label_pred)))
         print(classification_report(label_true, label_pred, digits=4))
 
+    # 量化检查：在测试集上比较 FP32 与 INT8 模型
+    def check_quantized(self, tolerance=QUANTIZE_TOLERANCE):
+        model = _load_model()
+        if _outdated(QUANTIZED_MODEL_PATH, MODEL_PATH):
+            quantize_model()
+        quantized = load_quantized_model()
+
+        label_true, fp32_pred, int8_pred = [], [], []
+        fp32_time = int8_time = 0.0
+        with torch.inference_mode():
+            for ids, att, tpe, label in self.test_loader:
+                start = time.time()
+                fp32_pred.extend(torch.argmax(model(ids, att, tpe), dim=1).tolist())
+                fp32_time += time.time() - start
+                start = time.time()
+                int8_pred.extend(torch.argmax(quantized(ids, att, tpe), dim=1).tolist())
+                int8_time += time.time() - start
+                label_true.extend(label.tolist())
+
+        fp32_acc = accuracy_score(label_true, fp32_pred)
+        int8_acc = accuracy_score(label_true, int8_pred)
+        changed = sum(a != b for a, b in zip(fp32_pred, int8_pred)) / len(label_true)
+        print("\n FP32 测试准确率 = {:.4f}, 耗时 {:.2f}秒".format(fp32_acc, fp32_time))
+        print(" INT8 测试准确率 = {:.4f}, 耗时 {:.2f}秒".format(int8_acc, int8_time))
+        print(
+            " 判定改变的比例 = {:.4f}, 加速 {:.2f} 倍".format(
+                changed, fp32_time / int8_time
+            )
+        )
+        passed = fp32_acc - int8_acc <= tolerance and changed <= tolerance
+        print(
+            " 量化检查{}（容差 {}）\n".format("通过" if passed else "未通过", tolerance)
+        )
+        return passed
+
+    # 导出检查：在测试集上比较 ONNX Runtime 与 PyTorch 的输出
+    def check_onnx(self, tolerance=ONNX_TOLERANCE):
+        model = _load_model()
+        if _outdated(ONNX_MODEL_PATH, MODEL_PATH):
+            export_onnx(model)
+        reference, onnx = TorchBackend(model, DEVICE), OnnxBackend()
+
+        max_diff, changed, total = 0.0, 0, 0
+        torch_time = onnx_time = 0.0
+        for ids, att, tpe, _ in self.test_loader:
+            ids, att, tpe = ids.numpy(), att.numpy(), tpe.numpy()
+            start = time.time()
+            expected = reference(ids, att, tpe)
+            torch_time += time.time() - start
+            start = time.time()
+            actual = onnx(ids, att, tpe)
+            onnx_time += time.time() - start
+            max_diff = max(max_diff, float(np.abs(expected - actual).max()))
+            changed += int((expected.argmax(axis=1) != actual.argmax(axis=1)).sum())
+            total += len(ids)
+
+        print(
+            "\n logits 最大差值 = {:.2e}, 判定改变 {}/{}".format(
+                max_diff, changed, total
+            )
+        )
+        print(
+            " PyTorch 耗时 {:.2f}秒, ONNX Runtime 耗时 {:.2f}秒".format(
+                torch_time, onnx_time
+            )
+        )
+        passed = max_diff <= tolerance and changed == 0
+        print(
+            " ONNX 检查{}（容差 {}）\n".format(
+                "通过" if passed else "未通过", tolerance
+            )
+        )
+        return passed
+
+    # 蒸馏检查：在测试集上比较教师模型与学生模型的准确率和速度
+    def check_student(self):
+        models = {
+            "教师": _load_model(),
+            "学生": _load_model(model_path=STUDENT_MODEL_PATH),
+        }
+        report = {}
+        for name, model in models.items():
+            label_true, label_pred = [], []
+            elapsed = 0.0
+            with torch.inference_mode():
+                for ids, att, tpe, label in self.test_loader:
+                    start = time.time()
+                    label_pred.extend(
+                        torch.argmax(model(ids, att, tpe), dim=1).tolist()
+                    )
+                    elapsed += time.time() - start
+                    label_true.extend(label.tolist())
+            report[name] = {
+                "layers": model.config.num_hidden_layers,
+                "parameters": sum(p.numel() for p in model.parameters()),
+                "accuracy": accuracy_score(label_true, label_pred),
+                "seconds": elapsed,
+            }
+
+        print("\n 模型  层数  参数量       测试准确率  耗时")
+        for name, r in report.items():
+            print(
+                " {}  {:<4}  {:<11,}  {:<10.4f}  {:.2f}秒".format(
+                    name, r["layers"], r["parameters"], r["accuracy"], r["seconds"]
+                )
+            )
+        teacher, student = report["教师"], report["学生"]
+        print(
+            " 学生模型加速 {:.2f} 倍，准确率变化 {:+.4f}\n".format(
+                teacher["seconds"] / student["seconds"],
+                student["accuracy"] - teacher["accuracy"],
+            )
+        )
+        return report
+
+    # 训练级联的轻量模型，与 BERT 使用相同的训练集
+    def train_cascade(self):
+        (train_tags, train_labels), (valid_tags, valid_labels), _ = self._load_tags()
+        start = time.time()
+        cascade = CascadeModel().fit(train_tags, train_labels)
+        cascade.save()
+        acc = accuracy_score(valid_labels, cascade.predict(valid_tags))
+        print(
+            "\n 轻量模型验证准确率 = {:.4f}, 耗时 {:.2f}秒\n".format(
+                acc, time.time() - start
+            )
+        )
+        return cascade
+
+    # 级联检查：在测试集上统计 BERT 的调用比例和轻量模型与 BERT 判定的一致性
+    def check_cascade(self):
+        cascade = CascadeModel.load()
+        model = _load_model()
+        test_tags, test_labels = self._load_tags()[2]
+        bert_pred = []
+        with torch.inference_mode():
+            for start in range(0, len(test_labels), BATCH_SIZE):
+                batch = self.test_split[start : start + BATCH_SIZE]
+                ids, att, tpe, _ = _collate(self.dataset, batch)
+                bert_pred.extend(torch.argmax(model(ids, att, tpe), dim=1).tolist())
+
+        print("\n 阈值     BERT 调用比例  一致率   级联准确率  BERT 准确率")
+        for threshold in (0.9, 0.95, 0.98, 0.99, 0.995):
+            sweep = CascadeModel(cascade.classifier, threshold, threshold)
+            r = cascade_report(sweep, test_tags, test_labels, bert_pred)
+            print(
+                " {:<8} {:<14.4f} {:<8.4f} {:<11.4f} {:.4f}".format(
+                    threshold,
+                    r["bert_rate"],
+                    r["agreement"],
+                    r["cascade_accuracy"],
+                    r["bert_accuracy"],
+                )
+            )
+        report = cascade_report(cascade, test_tags, test_labels, bert_pred)
+        print(
+            " 当前阈值（正常 {}，恶意 {}）: BERT 调用 {}/{}，一致率 {:.4f}\n".format(
+                cascade.benign,
+                cascade.malicious,
+                report["bert_calls"],
+                report["pages"],
+                report["agreement"],
+            )
+        )
+        return report
+
+    # 近似重复复用检查：按测试集的顺序模拟服务，统计复用的判定与 BERT 判定的一致率
+    def check_neighbours(self, confidence=SHIELD_NEIGHBOUR_CONFIDENCE):
+        model = _load_model()
+        test = self.test_split
+        bert_pred, bert_prob = [], []
+        with torch.inference_mode():
+            for start in range(0, len(test), BATCH_SIZE):
+                ids, att, tpe, _ = _collate(
+                    self.dataset, test[start : start + BATCH_SIZE]
+                )
+                prob, pred = torch.softmax(model(ids, att, tpe), dim=1).max(dim=1)
+                bert_pred.extend(pred.tolist())
+                bert_prob.extend(prob.tolist())
+        labels = self.dataset.labels[test.start : test.stop].tolist()
+        ids, offsets = self.dataset.ids, self.dataset.offsets
+        fingerprints = [simhash(ids[offsets[i] : offsets[i + 1]]) for i in test]
+
+        print("\n 距离  复用比例  与 BERT 一致率  复用准确率  整体准确率  BERT 准确率")
+        reports = {}
+        for distance in sorted({0, 1, 2, 3, 4, 6, SHIELD_NEIGHBOUR_DISTANCE}):
+            r = neighbour_report(
+                fingerprints, labels, bert_pred, bert_prob, distance, confidence
+            )
+            reports[distance] = r
+            print(
+                " {:<5} {:<9.4f} {:<15.4f} {:<11.4f} {:<11.4f} {:.4f}".format(
+                    distance,
+                    r["reuse_rate"],
+                    r["agreement"],
+                    r["reuse_accuracy"],
+                    r["accuracy"],
+                    r["bert_accuracy"],
+                )
+            )
+        report = reports[SHIELD_NEIGHBOUR_DISTANCE]
+        print(
+            " 当前设置（距离 {}，置信度 {}）: 复用 {}/{}，一致率 {:.4f}\n".format(
+                SHIELD_NEIGHBOUR_DISTANCE,
+                confidence,
+                report["reused"],
+                report["pages"],
+                report["agreement"],
+            )
+        )
+        return report
+
     # 训练函数
     def _train_and_eval(
-        self, model, train_loader, valid_loader, optimizer, scheduler, device, epoch
+        self,
+        model,
+        train_loader,
+        valid_loader,
+        optimizer,
+        scheduler,
+        device,
+        epoch,
+        teacher=None,
+        path=MODEL_PATH,
     ):
         best_acc = 0.0
         patience = 0
         criterion = nn.CrossEntropyLoss()
+        accum = GRAD_ACCUM_STEPS
+        report_every = max(1, len(train_loader) // 5)
         for i in range(epoch):
             """训练模型"""
             start = time.time()
             model.train()
             print("***** 正在运行训练周期 {} *****".format(i + 1))
             train_loss_sum = 0.0
+            tokens = padded = 0  # 实际词元数和补齐后的词元数
+            optimizer.zero_grad()
             for idx, (ids, att, tpe, y) in enumerate(train_loader):
                 ids, att, tpe, y = (
                     ids.to(device),
@@ -153,15 +577,37 @@ class Trainer:
                     tpe.to(device),
                     y.to(device),
                 )
-                y_pred = model(ids, att, tpe)
-                loss = criterion(y_pred, y)
-                optimizer.zero_grad()
-                loss.backward()
-                optimizer.step()
-                scheduler.step()  # 学习率变化
+                with torch.autocast(
+                    device_type=device.type, dtype=torch.bfloat16, enabled=TRAIN_BF16
+                ):
+                    y_pred = model(ids, att, tpe)
+                    if teacher is not None:
+                        with torch.no_grad():
+                            soft = teacher(ids, att, tpe)
+                loss = criterion(y_pred.float(), y)
+                if teacher is not None:
+                    # 学生同时拟合真实标签和教师在温度 T 下的软标签
+                    T = DISTILL_TEMPERATURE
+                    distill_loss = nn.functional.kl_div(
+                        nn.functional.log_softmax(y_pred.float() / T, dim=1),
+                        nn.functional.softmax(soft.float() / T, dim=1),
+                        reduction="batchmean",
+                    )
+                    loss = (
+                        DISTILL_ALPHA * distill_loss * T * T
+                        + (1 - DISTILL_ALPHA) * loss
+                    )
+                # 累积 accum 个批的梯度后再更新一次参数
+                (loss / accum).backward()
+                if (idx + 1) % accum == 0 or idx + 1 == len(train_loader):
+                    optimizer.step()
+                    scheduler.step()  # 学习率变化
+                    optimizer.zero_grad()
 
                 train_loss_sum += loss.item()
-                if (idx + 1) % (len(train_loader) // 5) == 0:  # 只打印五次结果
+                tokens += int(att.sum())
+                padded += ids.numel()
+                if (idx + 1) % report_every == 0:  # 只打印五次结果
                     print(
                         "周期 {:04d} | 步骤 {:04d}/{:04d} | 损失 {:.4f} | 时间 {:.4f}".format(
                             i + 1,
@@ -171,96 +617,253 @@ class Trainer:
                             time.time() - start,
                         )
                     )
+            train_time = time.time() - start
+            print(
+                "训练耗时 {:.2f}秒, {:.0f} 词元/秒, 补齐占比 {:.1%}".format(
+                    train_time, tokens / train_time, 1 - tokens / padded
+                )
+            )
             """验证模型"""
             model.eval()
             acc = self._evaluate(model, valid_loader, device)  # 验证模型的性能
             ## 保存最优模型
             if acc > best_acc:
                 best_acc = acc
-                torch.save(model.state_dict(), "best_bert_model.pth")
+                with replacing(path) as tmp:
+                    torch.save(model.state_dict(), tmp)
             print("当前准确率是 {:.4f}, 最高准确率是 {:.4f}".format(acc, best_acc))
             print("耗时 = {}秒 \n".format(round(time.time() - start, 5)))
 
 
 class Shield:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        backend=SHIELD_BACKEND,
+        warmup=SHIELD_WARMUP,
+        workers=SHIELD_WORKERS,
+        cascade=SHIELD_CASCADE,
+        student=SHIELD_STUDENT,
+        quantize=SHIELD_QUANTIZE,
+    ) -> None:
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"未知的 Shield 后端: {backend}")
+        if warmup not in ("eager", "background", "lazy"):
+            raise ValueError(f"未知的 Shield 加载方式: {warmup}")
+        self.backend_name = backend
+        self.warmup = warmup
+        self.workers = workers
+        self.use_cascade = cascade
+        self.model_path = STUDENT_MODEL_PATH if student else MODEL_PATH
+        self.quantize = quantize  # 只对 torch 后端有效
+        self.cascade = None
+        self._sources = Counter()  # 判定来源 -> 网页数
+        self._sources_lock = threading.Lock()
         self.label_map = {0: "恶意网页", 1: "正常网页"}
-        model = Bert_Model(BERT_PATH).to(DEVICE)
-        # 加载状态字典，strict=False以忽略意外的键
-        model.load_state_dict(
-            torch.load("best_bert_model.pth", map_location=DEVICE), strict=False
-        )
-        model.eval()
-        self.model = model
-        self.tokenizer = BertTokenizer.from_pretrained(BERT_PATH)
-
-    def _process_data(self, text):
-        soup = BeautifulSoup(text, "html.parser")
-        tags = []
-        for tag in soup.find_all(True):
-            tags.append(tag.name)
-        tags = " ".join(tags)
-
-        encode_dict = self.tokenizer.encode_plus(
-            text=tags, max_length=MAX_LEN, padding="max_length", truncation=True
-        )
+        self.neighbours = NeighbourIndex()
+        self.cache = None
+        self._loaded = threading.Event()
+        self._load_lock = threading.Lock()
+        self._load_error = None
+        self._load_seconds = None
+        if warmup == "eager":
+            self._load()
+        elif warmup == "background":
+            # 服务可以先启动，检测请求等待加载完成
+            threading.Thread(
+                target=self._load, name="shield-warmup", daemon=True
+            ).start()
 
-        input_ids = encode_dict["input_ids"]
-        input_types = encode_dict["token_type_ids"]
-        input_masks = encode_dict["attention_mask"]
-        return (
-            torch.LongTensor(
-                [
-                    input_ids,
-                ]
-            ),
-            torch.LongTensor(
-                [
-                    input_types,
-                ]
-            ),
-            torch.LongTensor(
-                [
-                    input_masks,
-                ]
-            ),
-        )
+    def _load(self) -> None:
+        with self._load_lock:
+            if self._loaded.is_set():
+                return
+            start = time.time()
+            try:
+                model_path = self.model_path
+                if self.backend_name == "onnx":
+                    weights = _derived_path(model_path, ONNX_MODEL_PATH, ".onnx")
+                    # 有训练好的权重且比导出的模型新时重新导出（需要 PyTorch）
+                    if not os.path.exists(weights) or (
+                        os.path.exists(model_path) and _outdated(weights, model_path)
+                    ):
+                        export_onnx(_load_model(model_path=model_path), weights)
+                    self.backend = OnnxBackend(weights)
+                else:
+                    self.model = _load_model(self.quantize, model_path)
+                    self.backend = TorchBackend(self.model, DEVICE)
+                    # 实际读取的是转换后的 .safetensors，部署时可以只有这个文件
+                    weights = _safetensors_path(model_path)
+                    if self.quantize:
+                        weights = _derived_path(
+                            model_path, QUANTIZED_MODEL_PATH, ".int8.pth"
+                        )
+                if self.workers:
+                    # 前向计算交给 fork 出的推理进程，预处理和缓存仍在本进程
+                    self.backend = WorkerPool(self.backend, self.workers)
+                if self.use_cascade:
+                    self.cascade = CascadeModel.load()
+                self.tokenizer = BertTokenizer.from_pretrained(BERT_PATH)
+                self.tag_tokenizer = TagTokenizer(self.tokenizer)
+                # 判定缓存按实际加载的权重区分版本；只看文件大小和修改时间，不在启动时读一遍
+                self.cache = VerdictCache(file_version(weights, self.backend_name))
+            except Exception as e:
+                self._load_error = e
+                raise
+            finally:
+                self._load_seconds = time.time() - start
+                self._loaded.set()
 
-    def __call__(self, tags: list) -> str:
-        result = self.model(*self._process_data(tags))
-        label = torch.argmax(result, dim=1).detach().cpu().numpy().tolist()[0]
-        return self.label_map[label]
+    def _ready(self) -> None:
+        # lazy 模式在这里加载，background 模式等待后台线程加载完成
+        if not self._loaded.is_set():
+            self._load()
+        if self._load_error is not None:
+            raise RuntimeError("Shield 模型加载失败") from self._load_error
 
-    def _test(self, tags):
-        encode_dict = self.tokenizer.encode_plus(
-            text=tags, max_length=MAX_LEN, padding="max_length", truncation=True
-        )
+    def status(self) -> dict:
+        """模型加载状态，state 为 loading、ready 或 failed"""
+        if not self._loaded.is_set():
+            state = "loading"
+        else:
+            state = "failed" if self._load_error is not None else "ready"
+        return {
+            "state": state,
+            "backend": self.backend_name,
+            "warmup": self.warmup,
+            "load_seconds": self._load_seconds,
+            "error": str(self._load_error) if self._load_error is not None else None,
+        }
 
-        input_ids = encode_dict["input_ids"]
-        input_types = encode_dict["token_type_ids"]
-        input_masks = encode_dict["attention_mask"]
-        result = self.model(
-            torch.LongTensor(
-                [
-                    input_ids,
-                ]
-            ),
-            torch.LongTensor(
-                [
-                    input_types,
-                ]
-            ),
-            torch.LongTensor(
-                [
-                    input_masks,
-                ]
-            ),
-        )
-        label = torch.argmax(result, dim=1).detach().cpu().numpy().tolist()[0]
-        return self.label_map[label]
+    def stats(self) -> dict:
+        """判定来源、缓存、近似重复复用和推理进程统计"""
+        with self._sources_lock:
+            sources = dict(self._sources)
+        pages = sum(sources.values())
+        stats = {
+            # 各来源的网页数，model 即实际调用模型的次数
+            "sources": sources,
+            "model_rate": sources.get("model", 0) / pages if pages else 0,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "neighbours": self.neighbours.stats(),
+        }
+        if self.workers:
+            pool = getattr(self, "backend", None)
+            stats["workers"] = pool.stats() if isinstance(pool, WorkerPool) else None
+        return stats
+
+    def _tags(self, html: str) -> list:
+        # 网页按标签名序列分类，与训练数据格式一致；分词器只保留前 MAX_LEN 个词，
+        # 收集到足够的标签就停止解析
+        return extract_tags(html)
+
+    def _result(self, label: int, probability: float, source: str, **extra) -> dict:
+        return {
+            "label": self.label_map[label],
+            "probability": probability,
+            "source": source,
+            **extra,
+        }
+
+    def _classify(self, tags: list, batch_size: int) -> list:
+        if not tags:
+            return []
+        self._ready()
+        input_ids = [self.tag_tokenizer.encode(tag_list) for tag_list in tags]
+        keys = [self.cache.key(ids) for ids in input_ids]
+        results = [None] * len(tags)
+        pending = {}  # 缓存未命中的键 -> 第一个这样的网页，相同输入只计算一次
+        for i, key in enumerate(keys):
+            if key in pending:
+                continue
+            verdict = self.cache.get(key)
+            if verdict is None:
+                pending[key] = i
+            else:
+                results[i] = self._result(*verdict, "cache")
+
+        # 与已有高置信度判定近似重复的网页直接复用判定
+        fingerprints = {}
+        for key, i in list(pending.items()) if self.neighbours.size else ():
+            fingerprints[i] = simhash(input_ids[i])
+            neighbour = self.neighbours.find(fingerprints[i])
+            if neighbour is not None:
+                label, probability, distance = neighbour
+                results[i] = self._result(
+                    label, probability, "neighbour", distance=distance
+                )
+                del pending[key]
+
+        if self.cascade is not None and pending:
+            # 轻量模型有把握的网页不再交给 BERT
+            items = list(pending.items())
+            decisions = self.cascade.decide([tags[i] for _, i in items])
+            for (key, i), decision in zip(items, decisions):
+                if decision is not None:
+                    results[i] = self._result(*decision, "cascade")
+                    del pending[key]
+
+        # 先按长度排序再分批，每批只补齐到批内最长的序列
+        order = sorted(pending.values(), key=lambda i: len(input_ids[i]))
+        for start in range(0, len(order), batch_size):
+            batch = order[start : start + batch_size]
+            width = max(len(input_ids[i]) for i in batch)
+            ids = np.full((len(batch), width), self.tag_tokenizer.pad, np.int64)
+            masks = np.zeros((len(batch), width), np.int64)
+            for row, i in enumerate(batch):
+                ids[row, : len(input_ids[i])] = input_ids[i]
+                masks[row, : len(input_ids[i])] = 1
+            logits = self.backend(ids, masks, np.zeros_like(ids))
+            # softmax，先减去最大值避免溢出
+            probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probs /= probs.sum(axis=1, keepdims=True)
+            for row, i in enumerate(batch):
+                label = int(probs[row].argmax())
+                probability = float(probs[row, label])
+                self.cache.put(keys[i], label, probability)
+                if i in fingerprints:
+                    self.neighbours.add(fingerprints[i], label, probability)
+                results[i] = self._result(label, probability, "model")
+
+        first = {}
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                # 与同一批中前面的网页输入相同
+                result = results[first[key]]
+                if result["source"] == "model":
+                    result = {**result, "source": "cache"}
+                results[i] = result
+            else:
+                first.setdefault(key, i)
+        with self._sources_lock:
+            self._sources.update(result["source"] for result in results)
+        return results
+
+    def predict_batch(self, htmls, batch_size: int = SHIELD_BATCH_SIZE) -> list:
+        """批量检测网页，返回与 htmls 顺序一致的 {"label": 标签, "probability": 概率,
+        "source": "model"、"cache"、"neighbour" 或 "cascade"}"""
+        return self._classify([self._tags(html) for html in htmls], batch_size)
+
+    def __call__(self, html: str) -> str:
+        return self.predict_batch([html])[0]["label"]
+
+    def _test(self, tags):
+        return self._classify([tags], 1)[0]["label"]
 
 
 # a = Shield() # 实例化Shield类
 # print(a("html head script script")) # 打印调用结果
 
 # Trainer()._predict() # 调用Trainer类的_predict方法
+
+# quantize_model() # 生成INT8量化模型，配置 SHIELD_QUANTIZE = True 后 Shield 使用它
+# Trainer().check_quantized() # 在测试集上检查量化模型的准确率
+
+# export_onnx(_load_model()) # 导出ONNX模型，配置 SHIELD_BACKEND = "onnx" 后 Shield 使用它
+# Trainer().check_onnx() # 在测试集上检查ONNX模型与PyTorch模型输出一致
+
+# Trainer().train_cascade() # 训练级联的轻量模型，配置 SHIELD_CASCADE = True 后 Shield 先用它判定
+# Trainer().check_cascade() # 在测试集上报告BERT的调用比例和轻量模型与BERT判定的一致率
+# Trainer().check_neighbours() # 在测试集上报告近似重复复用的比例和与BERT判定的一致率
+
+# Trainer().distill() # 蒸馏得到学生模型，配置 SHIELD_STUDENT = True 后 Shield 使用它
+# Trainer().check_student() # 在测试集上比较教师模型与学生模型的准确率和速度
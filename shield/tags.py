@@ -0,0 +1,40 @@
+from html.parser import HTMLParser
+from config.config import *
+
+# 每个标签名至少产生一个 WordPiece，分词器截断到 MAX_LEN 时最多用到这么多个标签（去掉 [CLS]、[SEP]）
+TAG_LIMIT = MAX_LEN - 2
+
+
+class _Enough(Exception):
+    pass
+
+
+class TagExtractor(HTMLParser):
+    """按出现顺序收集开始标签名，收集到 limit 个后立即停止解析
+
+    BeautifulSoup 的 html.parser 也是由 HTMLParser 驱动，每个开始标签生成一个节点，
+    因此结果与 BeautifulSoup(html, "html.parser").find_all(True) 的标签名序列相同
+    """
+
+    def __init__(self, limit: int = None) -> None:
+        # 与 BeautifulSoup 一样自己处理字符引用，保证切分方式一致
+        super().__init__(convert_charrefs=False)
+        self.limit = limit
+        self.tags = []
+
+    def handle_starttag(self, tag, attrs) -> None:
+        # <br/> 这类自闭合标签经 handle_startendtag 也会调用这里
+        self.tags.append(tag)
+        if self.limit is not None and len(self.tags) >= self.limit:
+            raise _Enough
+
+
+def extract_tags(html: str, limit: int = TAG_LIMIT) -> list:
+    """网页的前 limit 个标签名，limit 为 None 时返回全部"""
+    parser = TagExtractor(limit)
+    try:
+        parser.feed(html)
+        parser.close()
+    except _Enough:
+        pass
+    return parser.tags
@@ -0,0 +1,65 @@
+import re
+from config.config import *
+
+# 只由小写字母和数字组成的词表项，BertTokenizer 会原样切成这一个 WordPiece
+PLAIN_WORD = re.compile(r"[a-z0-9]+")
+CACHE_LIMIT = 100_000  # 回退到分词器得到的结果最多缓存这么多个标签名
+
+
+class TagTokenizer:
+    """标签名 -> WordPiece 编号的缓存，查表拼接得到与 encode_plus 完全相同的输入
+
+    Shield 的输入是以空格连接的标签名，分词器对每个标签名独立切分，
+    因此整串的切分结果等于各标签名切分结果依次相连；
+    词表中没有的标签名交给分词器切分一次后缓存
+    """
+
+    def __init__(self, tokenizer, max_len: int = MAX_LEN) -> None:
+        self.tokenizer = tokenizer
+        self.max_len = max_len
+        self.cls = tokenizer.cls_token_id
+        self.sep = tokenizer.sep_token_id
+        self.pad = tokenizer.pad_token_id
+        self.pieces = {
+            word: (i,)
+            for word, i in tokenizer.get_vocab().items()
+            if PLAIN_WORD.fullmatch(word)
+        }
+        self.misses = 0  # 回退到分词器的次数
+
+    def _pieces(self, tag: str) -> tuple:
+        pieces = self.pieces.get(tag)
+        if pieces is None:
+            self.misses += 1
+            tokens = self.tokenizer.tokenize(tag)
+            pieces = tuple(self.tokenizer.convert_tokens_to_ids(tokens))
+            if len(self.pieces) < CACHE_LIMIT:
+                self.pieces[tag] = pieces
+        return pieces
+
+    def encode(self, tags) -> list:
+        """[CLS] + 前 max_len - 2 个 WordPiece + [SEP]，不补齐
+
+        tags 为标签名列表或以空格连接的字符串
+        """
+        if isinstance(tags, str):
+            tags = tags.split(" ")
+        limit = self.max_len - 1
+        ids = [self.cls]
+        for tag in tags:
+            ids.extend(self._pieces(tag))
+            if len(ids) >= limit:
+                del ids[limit:]
+                break
+        ids.append(self.sep)
+        return ids
+
+    def encode_plus(self, tags) -> dict:
+        """与 tokenizer.encode_plus(padding="max_length", truncation=True) 的结果相同"""
+        ids = self.encode(tags)
+        padding = self.max_len - len(ids)
+        return {
+            "input_ids": ids + [self.pad] * padding,
+            "token_type_ids": [0] * self.max_len,
+            "attention_mask": [1] * len(ids) + [0] * padding,
+        }
@@ -0,0 +1,589 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from array import array
+from config.config import DEFAULT_LIST
+from sword.prefilter import Prefilter, np
+from sword.variants import normalize, separators, variants
+
+# 索引文件格式（小端，均为 uint32）：
+#   头部: MAGIC, 版本, 槽位数, 字母表大小, 字符映射条数, 关键字数, 关键字区字节数,
+#         列表数, 列表名区字节数, 校验和（版本 3 之前没有列表数和列表名区字节数）
+#   字符映射: (码位, 字母编号) * 字符映射条数，包含关键字字符的大写、全角、繁体写法，
+#             编号为 0 的是匹配时跳过的分隔字符（版本 2 起；版本 4 起只有零宽字符和少量标点）
+#   双数组: base, check, fail, out, word 各占 槽位数 个元素
+#   关键字偏移: 关键字数 + 1 个元素，随后是 utf-8 编码的关键字区（补齐到 4 字节）
+#   列表位图: 每个关键字 ceil(列表数 / 32) 个元素，第 i 位表示属于第 i 个列表；
+#             随后是以换行分隔的列表名区（补齐到 4 字节）（版本 3 起）
+# check[t] 保存父槽位 + 1，0 表示空槽；word[t] 保存关键字编号 + 1，0 表示非终止状态
+MAGIC = b"SWIX"
+VERSION = 4
+SKIPPED_LIMIT = 4096  # 最多记住这么多个被跳过的分隔字符位置
+SEPARATOR_GAP = 2  # 关键字相邻两个字之间最多跳过的分隔字符数
+PREAMBLE = struct.Struct("<4sI")
+HEADER_V2 = struct.Struct("<4sIIIIIII")
+HEADER = struct.Struct("<4sIIIIIIIII")
+PREFILTER_MIN_LEN = 512  # 短文本直接逐字符扫描
+PREFILTER_DENSITY = 0.2  # 候选起点超过该比例时预过滤不划算
+PREFILTER_PROBE = 64  # 每隔这么多次长文本查找，用当前较慢的方式再测一次耗时
+
+
+class IndexFormatError(ValueError):
+    pass
+
+
+class Automaton:
+    """由关键字编译出的 Aho-Corasick 自动机，一次线性扫描即可找出全部匹配"""
+
+    def __init__(self, keywords) -> None:
+        self.goto = [{}]  # 状态转移
+        self.fail = [0]  # 失败链接
+        self.word = [None]  # 以该状态结尾的关键字
+        self.out = [0]  # 输出链接：沿失败链最近的终止状态
+        for keyword in keywords:
+            self._insert(keyword)
+        self._link()
+
+    def _insert(self, keyword: str) -> None:
+        if not keyword:
+            return
+        state = 0
+        for char in keyword:
+            nxt = self.goto[state].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.word.append(None)
+                self.out.append(0)
+            state = nxt
+        self.word[state] = keyword
+
+    def _link(self) -> None:
+        # 按层次遍历计算失败链接和输出链接
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[nxt] = fail
+                self.out[nxt] = fail if self.word[fail] is not None else self.out[fail]
+
+    def keywords(self) -> list:
+        return [word for word in self.word if word is not None]
+
+    def find(self, text: str) -> list:
+        """返回 (起始位置, 关键字) 列表，按结束位置排列"""
+        goto, fail, word, out = self.goto, self.fail, self.word, self.out
+        root = goto[0]
+        matches = []
+        state = 0
+        for i, char in enumerate(text):
+            if state:
+                while True:
+                    nxt = goto[state].get(char)
+                    if nxt is not None:
+                        state = nxt
+                        break
+                    state = fail[state]
+                    if not state:
+                        state = root.get(char, 0)
+                        break
+            else:
+                state = root.get(char, 0)
+                if not state:
+                    continue
+
+            hit = state if word[state] is not None else out[state]
+            while hit:
+                keyword = word[hit]
+                matches.append((i - len(keyword) + 1, keyword))
+                hit = out[hit]
+        return matches
+
+
+def _entries(keywords) -> dict:
+    # 关键字 -> 所属列表名集合，不带列表的关键字属于默认列表
+    if isinstance(keywords, dict):
+        items = keywords.items()
+    else:
+        items = ((keyword, (DEFAULT_LIST,)) for keyword in keywords)
+    entries = {}
+    for keyword, lists in items:
+        if keyword:
+            entries.setdefault(normalize(keyword), set()).update(lists)
+    return entries
+
+
+def build_index(keywords) -> bytes:
+    """把关键字编译为双数组 Aho-Corasick 索引，返回索引文件内容
+
+    keywords 可以是关键字序列（全部属于默认列表），也可以是 {关键字: 列表名序列}；
+    所有列表共用一个自动机，每个关键字带一个列表位图。
+    关键字先转为规范形式，各字符的其他写法映射到同一个字母编号，
+    扫描原文一次即可匹配所有写法
+    """
+    entries = _entries(keywords)
+    keywords = sorted(entries)
+    automaton = Automaton(keywords)
+    goto = automaton.goto
+
+    alphabet = {char: i + 1 for i, char in enumerate(sorted(set("".join(keywords))))}
+
+    # 按层次遍历为每个状态分配槽位，子状态位于 base[父] + 字母编号
+    # used 末尾始终留有一个字母表大小的空白，检查槽位时无需判断越界
+    width = len(alphabet) + 1
+    slot = [0] * len(goto)
+    bases = {}
+    used = bytearray(1 + width)
+    used[0] = 1
+    free = 1  # 第一个空槽
+    crowded = 1  # 多个子状态从这里开始搜索，跳过已经很拥挤的区间
+    queue = deque([0])
+    while queue:
+        state = queue.popleft()
+        children = sorted((alphabet[char], nxt) for char, nxt in goto[state].items())
+        if not children:
+            continue
+        first = children[0][0]
+        rest = [label for label, _ in children[1:]]
+        pos = used.find(0, max(first, free, crowded if rest else 0))
+        tried = 0
+        while True:
+            b = pos - first
+            if all(not used[b + label] for label in rest):
+                break
+            tried += 1
+            pos = used.find(0, pos + 1)
+        if tried > 32:
+            crowded = pos
+        bases[slot[state]] = b
+        for label, nxt in children:
+            slot[nxt] = b + label
+            used[b + label] = 1
+            queue.append(nxt)
+        if len(used) < pos + 2 * width:
+            used.extend(bytes(pos + 2 * width - len(used)))
+        free = used.find(0, free)
+
+    # 转移时 base + 编号 不会越界
+    size = max(max(bases.values(), default=0) + width, max(slot) + 1)
+    base = array("I", bytes(4 * size))
+    for s, b in bases.items():
+        base[s] = b
+    check = array("I", bytes(4 * size))
+    fail = array("I", bytes(4 * size))
+    out = array("I", bytes(4 * size))
+    word = array("I", bytes(4 * size))
+    word_id = {keyword: i + 1 for i, keyword in enumerate(keywords)}
+    for state in range(1, len(goto)):
+        fail[slot[state]] = slot[automaton.fail[state]]
+        out[slot[state]] = slot[automaton.out[state]]
+        if automaton.word[state] is not None:
+            word[slot[state]] = word_id[automaton.word[state]]
+    for state, children in enumerate(goto):
+        for nxt in children.values():
+            check[slot[nxt]] = slot[state] + 1
+
+    mapping = dict(alphabet)
+    for char, label in alphabet.items():
+        for variant in variants(char):
+            mapping.setdefault(variant, label)
+    for char in separators():
+        mapping.setdefault(char, 0)
+    chars = array("I")
+    for char, label in sorted(mapping.items()):
+        chars.extend((ord(char), label))
+
+    blob = b"".join(keyword.encode("utf-8") for keyword in keywords)
+    offsets = array("I", [0])
+    for keyword in keywords:
+        offsets.append(offsets[-1] + len(keyword.encode("utf-8")))
+    blob += bytes(-len(blob) % 4)
+
+    lists = sorted(set().union(*entries.values()))
+    bit = {name: 1 << i for i, name in enumerate(lists)}
+    width = max(1, (len(lists) + 31) // 32)
+    masks = array("I")
+    for keyword in keywords:
+        mask = sum(bit[name] for name in entries[keyword])
+        masks.frombytes(mask.to_bytes(4 * width, "little"))
+    names = "\n".join(lists).encode("utf-8")
+
+    body = b"".join(
+        (
+            chars.tobytes(),
+            base.tobytes(),
+            check.tobytes(),
+            fail.tobytes(),
+            out.tobytes(),
+            word.tobytes(),
+            offsets.tobytes(),
+            blob,
+            masks.tobytes(),
+            names + bytes(-len(names) % 4),
+        )
+    )
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        size,
+        len(alphabet),
+        len(chars) // 2,
+        len(keywords),
+        offsets[-1],
+        len(lists),
+        len(names),
+        zlib.crc32(body),
+    )
+    return header + body
+
+
+def write_index(filename: str, keywords) -> None:
+    # 先写临时文件再替换，其他进程已映射的旧文件不受影响；
+    # 临时文件名带进程号，多个进程同时写入时不会互相覆盖或改名失败
+    data = build_index(keywords)
+    tmp = f"{filename}.tmp{os.getpid()}"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class KeywordIndex:
+    """只读的双数组 Aho-Corasick 索引，数组直接指向 mmap 或内存中的字节"""
+
+    def __init__(self, buffer) -> None:
+        view = memoryview(buffer)
+        if len(view) < HEADER_V2.size:
+            raise IndexFormatError("索引文件不完整")
+        magic, version = PREAMBLE.unpack_from(view)
+        if magic != MAGIC:
+            raise IndexFormatError("不是关键字索引文件")
+        if version not in (1, 2, 3, VERSION):
+            raise IndexFormatError(f"不支持的索引版本: {version}")
+        if version < 3:
+            header = HEADER_V2
+            _, _, size, _, n_chars, n_words, blob_len, crc = header.unpack_from(view)
+            n_lists = names_len = 0
+        else:
+            if len(view) < HEADER.size:
+                raise IndexFormatError("索引文件不完整")
+            header = HEADER
+            _, _, size, _, n_chars, n_words, blob_len, n_lists, names_len, crc = (
+                header.unpack_from(view)
+            )
+        body = view[header.size :]
+        if zlib.crc32(body) != crc:
+            raise IndexFormatError("索引文件校验和错误")
+
+        def section(offset, count):
+            return body[4 * offset : 4 * (offset + count)].cast("I"), offset + count
+
+        chars, offset = section(0, 2 * n_chars)
+        self.base, offset = section(offset, size)
+        self.check, offset = section(offset, size)
+        self.fail, offset = section(offset, size)
+        self.out, offset = section(offset, size)
+        self.word, offset = section(offset, size)
+        offsets, offset = section(offset, n_words + 1)
+        blob = body[4 * offset : 4 * offset + blob_len]
+        offset += (blob_len + 3) // 4
+        if n_lists:
+            self._width = (n_lists + 31) // 32
+            self._masks, offset = section(offset, n_words * self._width)
+            names = body[4 * offset : 4 * offset + names_len]
+            self.lists = bytes(names).decode("utf-8").split("\n")
+        else:
+            # 旧版本索引的关键字全部属于默认列表
+            self._width = 1
+            self._masks = None
+            self.lists = [DEFAULT_LIST]
+
+        self.alphabet = {chr(chars[i]): chars[i + 1] for i in range(0, len(chars), 2)}
+        self.words = [None] + [
+            bytes(blob[offsets[i] : offsets[i + 1]]).decode("utf-8")
+            for i in range(n_words)
+        ]
+        # 字母编号 -> 是否为拉丁字母或数字，这类字符之间的分隔字符不跳过
+        self._latin = bytearray(max(self.alphabet.values(), default=0) + 1)
+        for char, label in self.alphabet.items():
+            if label and char.isascii() and char.isalnum():
+                self._latin[label] = 1
+        # 根状态的转移：字符 -> 状态，扫描时不必为每个字符查字母表和双数组
+        start = self.base[0] if size else 0
+        self._root = {
+            char: start + label
+            for char, label in self.alphabet.items()
+            if label and start + label < size and self.check[start + label] == 1
+        }
+        self.version = version
+        self._buffer = buffer
+        self._prefilter = None
+        self._emits = None
+        # 整段扫描和预过滤最近测得的每字符耗时（秒），长文本查找时选用较快的一种
+        self._cost = {"scan": 0.0, "prefilter": 0.0}
+        self._finds = 0
+
+    @classmethod
+    def open(cls, filename: str) -> "KeywordIndex":
+        with open(filename, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def keywords(self, list_name: str = None) -> list:
+        if list_name is None:
+            return self.words[1:]
+        wanted = self.mask((list_name,))
+        return [
+            self.words[i] for i in range(1, len(self.words)) if self._mask(i) & wanted
+        ]
+
+    def __len__(self) -> int:
+        return len(self.words) - 1
+
+    def __contains__(self, keyword: str) -> bool:
+        return bool(self._lookup(keyword))
+
+    def _lookup(self, keyword: str) -> int:
+        # 关键字编号 + 1，不存在时返回 0
+        state = 0
+        for char in keyword:
+            label = self.alphabet.get(char)
+            if not label or self.check[self.base[state] + label] != state + 1:
+                return 0
+            state = self.base[state] + label
+        return self.word[state] if state else 0
+
+    def _mask(self, n: int) -> int:
+        # 编号 + 1 为 n 的关键字所属列表的位图
+        if self._masks is None:
+            return 1
+        if self._width == 1:
+            return self._masks[n - 1]
+        masks = self._masks[(n - 1) * self._width : n * self._width]
+        return int.from_bytes(masks.tobytes(), "little")
+
+    def mask(self, lists) -> int:
+        """列表名序列对应的位图，索引中没有的列表名忽略"""
+        lists = set(lists)
+        return sum(1 << i for i, name in enumerate(self.lists) if name in lists)
+
+    def lists_of(self, keyword: str) -> set:
+        """关键字所属的列表名，不在索引中时为空集合"""
+        n = self._lookup(keyword)
+        if not n:
+            return set()
+        mask = self._mask(n)
+        return {name for i, name in enumerate(self.lists) if mask >> i & 1}
+
+    def entries(self) -> dict:
+        """{关键字: 所属列表名集合}，可以直接传给 build_index"""
+        bits = list(enumerate(self.lists))
+        entries = {}
+        for n in range(1, len(self.words)):
+            mask = self._mask(n)
+            entries[self.words[n]] = {name for i, name in bits if mask >> i & 1}
+        return entries
+
+    def find(self, text: str, wanted: int = None) -> list:
+        """返回 (起始位置, 关键字) 列表，按结束位置排列
+
+        wanted 是 mask() 得到的列表位图，只返回属于这些列表的关键字；None 表示不限
+        """
+        if wanted == 0:
+            return []
+        if np is None or len(text) < PREFILTER_MIN_LEN:
+            return self.scan(text, wanted=wanted)[0]
+        # 预过滤是否划算取决于关键字的字母表和语料：候选起点多时 numpy 的开销
+        # 加上逐个候选调用自动机的开销反而超过整段扫描，因此按实测耗时选择
+        cost = self._cost
+        method = "prefilter" if cost["prefilter"] <= cost["scan"] else "scan"
+        self._finds += 1
+        if self._finds % PREFILTER_PROBE == 0:
+            method = "scan" if method == "prefilter" else "prefilter"
+        if method == "prefilter" and self._prefilter is None:
+            self._prefilter = Prefilter(self)  # 生成预过滤表的时间不计入
+        start = time.perf_counter()
+        if method == "scan":
+            matches = self.scan(text, wanted=wanted)[0]
+        else:
+            matches = self._prefiltered(text, wanted)
+        elapsed = (time.perf_counter() - start) / len(text)
+        # 指数滑动平均；第一次测量直接使用
+        cost[method] = 0.8 * cost[method] + 0.2 * elapsed if cost[method] else elapsed
+        return matches
+
+    def _prefiltered(self, text: str, wanted: int = None) -> list:
+        candidates = self._prefilter.candidates(text)
+        if len(candidates) > PREFILTER_DENSITY * len(text):
+            return self.scan(text, wanted=wanted)[0]
+
+        # 从每个候选起点运行自动机，直到回到根状态；
+        # 两个候选之间的字符都不能开始关键字，整段扫描时那里同样处于根状态
+        matches = []
+        end = 0
+        for start in candidates.tolist():
+            if start >= end:
+                end = self._run(text, start, matches, wanted)
+        return matches
+
+    def scan(
+        self,
+        text: str,
+        state: int = 0,
+        offset: int = 0,
+        skipped: list = None,
+        wanted: int = None,
+    ) -> tuple:
+        """从给定状态继续扫描一段文本，返回匹配和扫描结束时的状态
+
+        offset 是 text 在整个文档中的起始位置，跨段的匹配起始位置可能小于 offset；
+        分段扫描时 skipped 须在各段之间传递同一个列表
+        """
+        alphabet, base, check, fail = self.alphabet, self.base, self.check, self.fail
+        out, word, words = self.out, self.word, self.words
+        root, emits = self._root, self._emitting()
+        if skipped is None:
+            skipped = []
+        matches = []
+        for i, char in enumerate(text, offset):
+            if not state:
+                # 根状态下只有能开始关键字的字符会改变状态，网页中的大部分字符在这里跳过
+                state = root.get(char, 0)
+                if not state:
+                    continue
+            else:
+                label = alphabet.get(char)
+                if label is None:
+                    state = 0
+                    continue
+                if not label:
+                    # 分隔字符：匹配途中跳过，记下位置以便算出关键字在原文中的起点
+                    if self._gap_full(skipped, i):
+                        state = 0
+                        continue
+                    skipped.append(i)
+                    if len(skipped) > SKIPPED_LIMIT:
+                        del skipped[: SKIPPED_LIMIT // 2]
+                    continue
+                if skipped and skipped[-1] == i - 1 and self._joins_latin(state, label):
+                    state = root.get(char, 0)
+                else:
+                    while True:
+                        nxt = base[state] + label
+                        if check[nxt] == state + 1:
+                            state = nxt
+                            break
+                        state = fail[state]
+                        if not state:
+                            state = root.get(char, 0)
+                            break
+                if not state:
+                    continue
+
+            if state not in emits:
+                continue
+            hit = state if word[state] else out[state]
+            while hit:
+                if wanted is None or self._mask(word[hit]) & wanted:
+                    keyword = words[word[hit]]
+                    matches.append((_start(skipped, i, len(keyword)), keyword))
+                hit = out[hit]
+        return matches, state
+
+    def _emitting(self) -> frozenset:
+        # 以关键字结尾或有输出链接的状态；其余状态不必读 word 和 out 数组
+        if self._emits is None:
+            if np is not None:
+                word = np.frombuffer(self.word, dtype=np.uint32)
+                out = np.frombuffer(self.out, dtype=np.uint32)
+                slots = np.flatnonzero(word | out).tolist()
+            else:
+                slots = [
+                    s for s in range(len(self.word)) if self.word[s] or self.out[s]
+                ]
+            self._emits = frozenset(slots)
+        return self._emits
+
+    @staticmethod
+    def _gap_full(skipped: list, i: int) -> bool:
+        # i 之前已经连续跳过了 SEPARATOR_GAP 个分隔字符
+        return (
+            len(skipped) >= SEPARATOR_GAP
+            and skipped[-SEPARATOR_GAP] == i - SEPARATOR_GAP
+        )
+
+    def _joins_latin(self, state: int, label: int) -> bool:
+        # 分隔字符两侧都是拉丁字母或数字时不跳过，"tai-wan"、"s_bench" 不是关键字的变体写法；
+        # 状态的最后一个字由 check 数组中的父状态求出
+        latin = self._latin
+        return latin[label] and latin[state - self.base[self.check[state] - 1]]
+
+    def _run(self, text: str, i: int, matches: list, wanted: int = None) -> int:
+        alphabet, base, check, fail = self.alphabet, self.base, self.check, self.fail
+        out, word, words = self.out, self.word, self.words
+        emits = self._emitting()
+        skipped = []
+        state = 0
+        while i < len(text):
+            label = alphabet.get(text[i])
+            if label is None:
+                return i + 1
+            if not label:
+                if self._gap_full(skipped, i):
+                    return i + 1
+                skipped.append(i)
+                i += 1
+                continue
+            if (
+                state
+                and skipped
+                and skipped[-1] == i - 1
+                and self._joins_latin(state, label)
+            ):
+                # 从根状态重新开始，相当于在分隔字符处结束了匹配
+                state = 0
+            while True:
+                nxt = base[state] + label
+                if check[nxt] == state + 1:
+                    state = nxt
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            if not state:
+                return i + 1
+
+            if state not in emits:
+                i += 1
+                continue
+            hit = state if word[state] else out[state]
+            while hit:
+                if wanted is None or self._mask(word[hit]) & wanted:
+                    keyword = words[word[hit]]
+                    matches.append((_start(skipped, i, len(keyword)), keyword))
+                hit = out[hit]
+            i += 1
+        return i
+
+
+def _start(skipped: list, end: int, length: int) -> int:
+    # 关键字跨过的每个分隔字符都让起点再向前移一位
+    start = end - length + 1
+    j = len(skipped) - 1
+    while j >= 0 and skipped[j] >= start:
+        start -= 1
+        j -= 1
+    return start
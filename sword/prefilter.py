@@ -0,0 +1,88 @@
+try:
+    import numpy as np
+except ImportError:  # 没有 numpy 时 KeywordIndex 退回逐字符扫描
+    np = None
+
+BMP = 0x10000
+GRAM_MASK = (1 << 20) - 1
+
+
+def _gram(*labels):
+    value = labels[0].astype(np.uint64)
+    for label in labels[1:]:
+        value = (value * 0x9E3779B1) ^ label
+    return value & GRAM_MASK
+
+
+class Prefilter:
+    """在码位数组上批量找出可能的关键字起点，只有这些位置需要交给自动机
+
+    起点的字符必须能从根状态转移（首字位图），并且从它开始的前两个、前三个字符
+    必须是某个关键字的前缀（二元组、三元组位图，哈希后存放，允许误报）；
+    一个字、两个字的关键字只检查到自身长度。组成二元组、三元组时跳过分隔字符
+    """
+
+    def __init__(self, index) -> None:
+        base = np.frombuffer(index.base, dtype=np.uint32)
+        check = np.frombuffer(index.check, dtype=np.uint32)
+        word = np.frombuffer(index.word, dtype=np.uint32)
+
+        chars = np.fromiter(map(ord, index.alphabet), dtype=np.uint32)
+        labels = np.fromiter(index.alphabet.values(), dtype=np.uint32)
+        self.labels = np.zeros(BMP, dtype=np.uint32)
+        self.labels[chars[chars < BMP]] = labels[chars < BMP]
+        self.skip = np.zeros(BMP, dtype=bool)
+        self.skip[chars[(chars < BMP) & (labels == 0)]] = True
+        # 关键字里有 BMP 之外的字符时，这些位置一律作为候选
+        self.astral = bool((chars >= BMP).any())
+
+        # 由 check 数组还原每个状态的父状态和转移字符，再按深度取前三层
+        slots = np.flatnonzero(check)
+        parent = check[slots].astype(np.int64) - 1
+        label = np.zeros(len(check), dtype=np.uint32)
+        label[slots] = slots - base[parent]
+        up = np.zeros(len(check), dtype=np.int64)
+        up[slots] = parent
+        depth = np.zeros(len(check), dtype=np.uint8)
+        depth[slots[parent == 0]] = 1
+        for level in (2, 3):
+            depth[slots[depth[parent] == level - 1]] = level
+        one = np.flatnonzero(depth == 1)
+        two = np.flatnonzero(depth == 2)
+        three = np.flatnonzero(depth == 3)
+
+        size = int(labels.max(initial=0)) + 1
+        self.first = np.zeros(size, dtype=bool)
+        self.first[label[one]] = True
+        self.single = np.zeros(size, dtype=bool)
+        self.single[label[one[word[one] != 0]]] = True
+        self.pair = np.zeros(GRAM_MASK + 1, dtype=bool)
+        self.pair[_gram(label[up[two]], label[two])] = True
+        self.double = np.zeros(GRAM_MASK + 1, dtype=bool)
+        ends = two[word[two] != 0]
+        self.double[_gram(label[up[ends]], label[ends])] = True
+        self.triple = np.zeros(GRAM_MASK + 1, dtype=bool)
+        self.triple[_gram(label[up[up[three]]], label[up[three]], label[three])] = True
+
+    def candidates(self, text: str):
+        codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), np.uint32)
+        labels = self.labels[np.minimum(codes, BMP - 1)]
+        if len(codes) and codes.max() >= BMP:
+            labels[codes >= BMP] = 0
+        # 去掉分隔字符后再看相邻字符，最后换算回原文位置
+        kept = np.flatnonzero(~self.skip[np.minimum(codes, BMP - 1)] | (codes >= BMP))
+        labels = labels[kept]
+        second = np.zeros_like(labels)
+        second[:-1] = labels[1:]
+        third = np.zeros_like(labels)
+        third[:-2] = labels[2:]
+
+        hits = self.first[labels]
+        pairs = _gram(labels, second)
+        hits &= self.single[labels] | (
+            self.pair[pairs]
+            & (self.double[pairs] | self.triple[_gram(labels, second, third)])
+        )
+        if self.astral:
+            hits |= codes[kept] >= BMP
+        return kept[hits]
@@ -1,61 +1,435 @@
+import contextlib
+import functools
+import multiprocessing
+import os
 import pickle
+import threading
+import time
+from config.config import *
+from sword.index import (
+    VERSION,
+    IndexFormatError,
+    KeywordIndex,
+    build_index,
+    write_index,
+)
+from sword.variants import normalize
 
-keyword_tree = pickle.load(open("data/keyword_tree.pickle", "rb"))
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只在进程内串行化
+    fcntl = None
 
-def create_sword_by(filename: str) -> None:
-    global keyword_tree
-    with open(filename, encoding="utf-8") as f:
-        f = f.readlines()
-        for line in f:
-            line = line.strip()
-            keyword = line.lower() + "\x00"
-            if not keyword:
-                continue
 
-            tree = keyword_tree
-            for char in keyword:
-                if char in tree:
-                    tree = tree[char]
-                else:
-                    tree[char] = dict()
-                    tree = tree[char]
-        keyword_tree.pop("\x00")
-    pickle.dump(keyword_tree, open("data/keyword_tree.pickle", "wb"))
+class Matcher:
+    """基础索引加增量：新增的关键字编译成一个小自动机，删除的关键字从结果中过滤
 
+    added / removed 为 {关键字: 列表名集合}，分别记录基础索引之外新增的
+    和从基础索引中删除的 (关键字, 列表)。
+    实例创建后不再修改，更新时整体替换，正在执行的 sword() 调用不受影响
+    """
 
+    def __init__(self, index, added=None, removed=None, signature=None) -> None:
+        self.index = index
+        self.added = {k: frozenset(v) for k, v in (added or {}).items() if v}
+        self.removed = {k: frozenset(v) for k, v in (removed or {}).items() if v}
+        self.delta = KeywordIndex(build_index(self.added)) if self.added else None
+        self.signature = signature
+        # 增量涉及的关键字在基础索引中和现在所属的列表
+        self._base = {
+            keyword: frozenset(index.lists_of(keyword))
+            for keyword in self.added.keys() | self.removed.keys()
+        }
+        self._lists = {
+            keyword: (lists - self.removed.get(keyword, frozenset()))
+            | self.added.get(keyword, frozenset())
+            for keyword, lists in self._base.items()
+        }
 
-def sword(text: str) -> list:
-    text = text.lower() + "\x01"
-    keywords = []
-    keyword = ""
-
-    tree = keyword_tree
-
-    next_i = 0
-    i = 0
-    while i < len(text):
-        char = text[i]
-
-        if char in tree:
-            if "\x00" in tree:
-                keywords.append(keyword)
-            if tree == keyword_tree:
-                next_i = i + 1
-            keyword += char
-            tree = tree[char]
-            i += 1
+    def __contains__(self, keyword: str) -> bool:
+        return bool(self.lists_of(keyword))
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def lists_of(self, keyword: str) -> set:
+        if keyword in self._lists:
+            return set(self._lists[keyword])
+        return self.index.lists_of(keyword)
+
+    def count(self, list_name: str = None) -> int:
+        if list_name is None:
+            count = len(self.index)
+            for keyword, lists in self._lists.items():
+                count += bool(lists) - bool(self._base[keyword])
         else:
-            if tree != keyword_tree and "\x00" not in tree:
-                i = next_i
-                tree = keyword_tree
-                keyword = ""
-            elif "\x00" in tree:
-                keywords.append(keyword)
-                keyword = ""
-                tree = keyword_tree
-                i = next_i
+            count = len(self.index.keywords(list_name))
+            for keyword, lists in self._lists.items():
+                count += (list_name in lists) - (list_name in self._base[keyword])
+        return count
+
+    def keywords(self, list_name: str = None) -> set:
+        keywords = set(self.index.keywords(list_name))
+        for keyword, lists in self._lists.items():
+            if lists if list_name is None else list_name in lists:
+                keywords.add(keyword)
             else:
-                tree = keyword_tree
-                i += 1
-    
+                keywords.discard(keyword)
+        return keywords
+
+    def entries(self) -> dict:
+        """{关键字: 列表名集合}，用于把增量合并进索引文件"""
+        entries = self.index.entries()
+        for keyword, lists in self._lists.items():
+            if lists:
+                entries[keyword] = set(lists)
+            else:
+                entries.pop(keyword, None)
+        return entries
+
+    def _visible(self, matches: list, lists) -> list:
+        # 基础索引的匹配中去掉已从所查列表中删除的关键字
+        removed, current = self.removed, self._lists
+        return [
+            match
+            for match in matches
+            if match[1] not in removed
+            or (current[match[1]] if lists is None else current[match[1]] & lists)
+        ]
+
+    def find(self, text: str, lists=None) -> list:
+        lists = None if lists is None else frozenset(lists)
+        wanted = None if lists is None else self.index.mask(lists)
+        matches = self.index.find(text, wanted)
+        if self.removed:
+            matches = self._visible(matches, lists)
+        if self.delta is not None:
+            wanted = None if lists is None else self.delta.mask(lists)
+            delta_matches = self.delta.find(text, wanted)
+            if delta_matches:
+                # 同一个关键字可能既在基础索引中也在增量中（属于不同列表）
+                seen = set(matches)
+                matches.extend(m for m in delta_matches if m not in seen)
+        return matches
+
+    def stream(self, chunks, lists=None):
+        lists = None if lists is None else frozenset(lists)
+        wanted = None if lists is None else self.index.mask(lists)
+        if self.delta is not None:
+            delta_wanted = None if lists is None else self.delta.mask(lists)
+        state, delta_state, offset = 0, 0, 0
+        skipped, delta_skipped = [], []
+        for chunk in chunks:
+            matches, state = self.index.scan(chunk, state, offset, skipped, wanted)
+            if self.removed:
+                matches = self._visible(matches, lists)
+            if self.delta is not None:
+                delta_matches, delta_state = self.delta.scan(
+                    chunk, delta_state, offset, delta_skipped, delta_wanted
+                )
+                if delta_matches:
+                    seen = set(matches)
+                    matches.extend(m for m in delta_matches if m not in seen)
+                    matches.sort(key=lambda match: match[0] + len(match[1]))
+            yield from matches
+            offset += len(chunk)
+
+
+def _keywords_of(tree: dict, prefix: str = "") -> list:
+    keywords = []
+    for char, child in tree.items():
+        if char == "\x00":
+            keywords.append(prefix)
+        else:
+            keywords.extend(_keywords_of(child, prefix + char))
     return keywords
+
+
+def _signature() -> tuple:
+    # 索引和增量日志的修改时间与大小，用来发现其他进程写入的更新
+    signature = []
+    for filename in (INDEX_FILE, DELTA_FILE):
+        try:
+            stat = os.stat(filename)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _current_index():
+    # 当前版本的索引；不存在、损坏或是旧版本时返回 None
+    try:
+        index = KeywordIndex.open(INDEX_FILE)
+    except (FileNotFoundError, IndexFormatError):
+        return None
+    return index if index.version == VERSION else None
+
+
+def _convert_index() -> None:
+    """没有当前版本的索引时由旧版本索引或 pickle 生成，调用时持有独占的文件锁
+
+    多个进程同时启动时只有第一个拿到锁的进程转换，其余的重新检查后直接使用它的结果
+    """
+    if _current_index() is not None:
+        return
+    try:
+        index = KeywordIndex.open(INDEX_FILE)
+    except (FileNotFoundError, IndexFormatError):
+        if not os.path.exists(PICKLE_FILE):
+            raise
+    else:
+        # 旧版本索引没有编译各种写法和列表，用其中的关键字重新生成一次
+        write_index(INDEX_FILE, index.entries())
+        return
+    # 旧版本只有 pickle 形式的关键字树，转换一次后改用索引文件
+    with open(PICKLE_FILE, "rb") as f:
+        keyword_tree = pickle.load(f)
+    write_index(INDEX_FILE, _keywords_of(keyword_tree))
+
+
+def _list_name(name: str) -> str:
+    if not isinstance(name, str) or not name.strip() or "\n" in name or "\t" in name:
+        raise ValueError(f"无效的列表名: {name!r}")
+    return name.strip()
+
+
+def _apply(index, added: dict, removed: dict, op: str, name: str, keyword: str):
+    # 增量日志中的一条记录：op 为 "+" 或 "-"，name 为列表名
+    # 不在基础索引中的加入 added，在基础索引中的删除记入 removed，反向操作则撤销记录
+    in_index = name in index.lists_of(keyword)
+    if (op == "+") != in_index:
+        target = added if op == "+" else removed
+        target.setdefault(keyword, set()).add(name)
+    else:
+        target = removed if op == "+" else added
+        if keyword in target:
+            target[keyword].discard(name)
+            if not target[keyword]:
+                del target[keyword]
+
+
+def _load() -> Matcher:
+    signature = _signature()
+    index = KeywordIndex.open(INDEX_FILE)
+    added, removed = {}, {}
+    if os.path.exists(DELTA_FILE):
+        with open(DELTA_FILE, encoding="utf-8") as f:
+            for line in f:
+                op, rest = line[:1], line[1:].rstrip("\n")
+                # "+列表名\t关键字"，早期的日志没有列表名，属于默认列表
+                name, _, keyword = rest.rpartition("\t")
+                if op in ("+", "-") and keyword:
+                    _apply(index, added, removed, op, name or DEFAULT_LIST, keyword)
+    return Matcher(index, added, removed, signature)
+
+
+@contextlib.contextmanager
+def _file_lock(shared: bool = False):
+    """跨进程的文件锁：写入索引和增量日志时独占，读取时共享
+
+    flock 属于打开的文件，同一进程内重复加锁会互相等待，调用前须先持有 _lock
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(LOCK_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+_lock = threading.Lock()  # 串行化进程内的写操作，读操作不加锁
+if _current_index() is None:
+    with _file_lock():
+        _convert_index()
+with _file_lock(shared=True):
+    matcher = _load()
+_checked = time.monotonic()
+
+
+def _reload() -> None:
+    # 调用时持有 _lock 和文件锁；其他进程更新过索引或增量日志时重新加载
+    global matcher
+    if _signature() != matcher.signature:
+        matcher = _load()
+
+
+def _refresh() -> None:
+    # 其他进程（如另一个 gunicorn worker）更新了关键字时重新加载
+    global _checked
+    now = time.monotonic()
+    if now - _checked < RELOAD_INTERVAL:
+        return
+    _checked = now
+    if _signature() != matcher.signature:
+        with _lock, _file_lock(shared=True):
+            _reload()
+
+
+def _rebuild(entries: dict) -> None:
+    # 调用时持有 _lock 和独占的文件锁
+    global matcher
+    write_index(INDEX_FILE, entries)
+    if os.path.exists(DELTA_FILE):
+        os.remove(DELTA_FILE)
+    matcher = Matcher(KeywordIndex.open(INDEX_FILE), signature=_signature())
+
+
+def _update(op: str, keywords, list_name: str = None) -> int:
+    global matcher
+    with _lock, _file_lock():
+        # 在最新的索引和增量上修改，否则会覆盖或在合并时丢掉其他进程的更新
+        _reload()
+        current = matcher
+        added = {keyword: set(lists) for keyword, lists in current.added.items()}
+        removed = {keyword: set(lists) for keyword, lists in current.removed.items()}
+        lines = []
+        for keyword in keywords:
+            keyword = normalize(keyword.strip())
+            if not keyword or "\n" in keyword or "\t" in keyword:
+                continue
+            lists = (current.index.lists_of(keyword) - removed.get(keyword, set())) | (
+                added.get(keyword, set())
+            )
+            if op == "+":
+                names = [] if list_name in lists else [list_name]
+            elif list_name is None:
+                names = sorted(lists)
+            else:
+                names = [list_name] if list_name in lists else []
+            for name in names:
+                _apply(current.index, added, removed, op, name, keyword)
+                lines.append(f"{op}{name}\t{keyword}\n")
+        if not lines:
+            return 0
+
+        changes = sum(map(len, added.values())) + sum(map(len, removed.values()))
+        if changes > DELTA_LIMIT:
+            # 增量过多时合并进索引文件，并清空增量日志
+            _rebuild(Matcher(current.index, added, removed).entries())
+        else:
+            # 记录追加之前的签名：即使签名没能反映这次之后的变化，下次检查也会重新加载
+            signature = _signature()
+            with open(DELTA_FILE, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+            matcher = Matcher(current.index, added, removed, signature)
+        return len(lines)
+
+
+def add_keywords(keywords, list_name: str = DEFAULT_LIST) -> int:
+    """在运行中的进程里把关键字加入列表，返回实际新增的数量"""
+    return _update("+", keywords, _list_name(list_name))
+
+
+def remove_keywords(keywords, list_name: str = None) -> int:
+    """在运行中的进程里删除关键字，返回实际删除的数量
+
+    list_name 为 None 时从所有列表中删除
+    """
+    if list_name is not None:
+        list_name = _list_name(list_name)
+    return _update("-", keywords, list_name)
+
+
+def keyword_count(list_name: str = None) -> int:
+    return matcher.count(list_name)
+
+
+def keyword_lists() -> list:
+    """索引中已有的列表名"""
+    names = set(matcher.index.lists)
+    for lists in matcher.added.values():
+        names |= lists
+    return sorted(names)
+
+
+def create_sword_by(filename: str, list_name: str = DEFAULT_LIST) -> None:
+    """从关键字文件（每行一个）生成索引，文件中的关键字加入 list_name 列表"""
+    list_name = _list_name(list_name)
+    with open(filename, encoding="utf-8") as f:
+        keywords = {normalize(line.strip()) for line in f if line.strip()}
+    with _lock, _file_lock():
+        _reload()
+        entries = matcher.entries()
+        for keyword in keywords:
+            entries.setdefault(keyword, set()).add(list_name)
+        _rebuild(entries)
+
+
+def sword(text: str, lists=None) -> list:
+    """检测文本中的关键字，lists 为列表名序列时只返回属于其中任一列表的关键字
+
+    所有列表共用一个自动机，无论查询多少个列表都只扫描一遍
+    """
+    _refresh()
+    # 与原先的回溯实现保持相同的输出顺序：按起始位置，再按长度
+    # 大小写、全角、繁体和分隔字符都已编译进索引，直接扫描原文
+    matches = matcher.find(text, lists)
+    matches.sort(key=lambda match: (match[0], len(match[1])))
+    return [keyword for _, keyword in matches]
+
+
+def sword_stream(chunks, lists=None):
+    """逐块扫描文本，边读边产出 (起始位置, 关键字)，按关键字结束位置排列
+
+    chunks 可以是任意字符串迭代器，例如以文本模式打开的文件；
+    自动机状态在块之间延续，跨越块边界的关键字不会漏掉
+    """
+    _refresh()
+    yield from matcher.stream(chunks, lists)
+
+
+def sword_file(filename: str, chunk_size: int = 1 << 20, lists=None) -> list:
+    """分块读取文件并检测关键字，结果与 sword(整个文件内容) 相同"""
+    with open(filename, encoding="utf-8", errors="ignore") as f:
+        matches = list(sword_stream(iter(lambda: f.read(chunk_size), ""), lists))
+    matches.sort(key=lambda match: (match[0], len(match[1])))
+    return [keyword for _, keyword in matches]
+
+
+_pool = None  # start_pool() 创建的常驻进程池
+_pool_workers = 0
+
+
+def _context():
+    # fork 不会在子进程里重新执行主模块（例如 app.py 加载 Shield 模型）
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("fork" if "fork" in methods else None)
+
+
+def start_pool(workers: int = None) -> None:
+    """创建供 sword_many 使用的常驻进程池，多线程的服务应在启动线程之前调用
+
+    在已有其他线程的进程中 fork 可能复制被持有的锁而死锁，每个请求创建进程池也很昂贵；
+    工作进程检测前同样检查索引文件，运行中增删的关键字随后生效
+    """
+    global _pool, _pool_workers
+    workers = workers or os.cpu_count() or 1
+    if _pool is None and workers > 1:
+        _pool = _context().Pool(workers)
+        _pool_workers = workers
+
+
+def sword_many(texts, workers: int = None, chunksize: int = None, lists=None) -> list:
+    """用进程池批量检测，返回结果的顺序与 texts 一致
+
+    工作进程各自 mmap 同一个索引文件（fork 时直接继承映射），不复制关键字数据。
+    总字符数少于 SWORD_PARALLEL_MIN_CHARS 时在本进程中逐个检测；调用过 start_pool()
+    时使用常驻进程池（workers 不再起作用），否则临时创建进程池
+    """
+    texts = list(texts)
+    if _pool is not None:
+        workers = _pool_workers
+    workers = min(workers or os.cpu_count() or 1, len(texts))
+    if workers <= 1 or sum(map(len, texts)) < SWORD_PARALLEL_MIN_CHARS:
+        return [sword(text, lists) for text in texts]
+    if chunksize is None:
+        chunksize = max(1, len(texts) // (workers * 4))
+    scan = functools.partial(sword, lists=lists)
+    if _pool is not None:
+        return _pool.map(scan, texts, chunksize)
+    with _context().Pool(workers) as pool:
+        return pool.map(scan, texts, chunksize)
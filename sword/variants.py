@@ -0,0 +1,60 @@
+import os
+from functools import lru_cache
+from config.config import *
+
+# 零宽字符和软连字符，常被插在关键字中间逃避检测
+ZERO_WIDTH = "\u00ad\u180e\u200b\u200c\u200d\u2060\ufeff"
+# 常被用来隔开关键字各个字的标点（含全角写法）；空白和 <>"=/ 等 HTML 标记字符不在其中，
+# 否则关键字会跨越单词和标签匹配
+PUNCTUATION = "*-_.,|~+#!·•、，。．・＊－＿｜～＋＃！"
+
+
+@lru_cache(maxsize=None)
+def _traditional() -> dict:
+    # 繁体字 -> 简体字
+    table = {}
+    if os.path.exists(VARIANT_FILE):
+        with open(VARIANT_FILE, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 2 and parts[0] and parts[1]:
+                    table[parts[0]] = parts[1]
+    return table
+
+
+def normalize(keyword: str) -> str:
+    """关键字的规范形式：小写、全角转半角、繁体转简体"""
+    traditional = _traditional()
+    chars = []
+    for char in keyword.lower():
+        code = ord(char)
+        if 0xFF01 <= code <= 0xFF5E:
+            char = chr(code - 0xFEE0).lower()
+        elif code == 0x3000:
+            char = " "
+        chars.append(traditional.get(char, char))
+    return "".join(chars)
+
+
+@lru_cache(maxsize=None)
+def _forms() -> dict:
+    # 规范字符 -> 规范化后等于它的其他单个字符（大写、全角、繁体）
+    forms = {}
+    candidates = {chr(code) for code in range(0x10000) if not 0xD800 <= code < 0xE000}
+    for char in candidates | set(_traditional()):
+        canonical = normalize(char)
+        if len(canonical) == 1 and canonical != char:
+            forms.setdefault(canonical, []).append(char)
+    return forms
+
+
+def variants(char: str) -> list:
+    """文本中应当按 char 匹配的其他写法，char 须为规范形式"""
+    return _forms().get(char, [])
+
+
+def separators() -> frozenset:
+    """匹配过程中可以跳过的分隔字符：零宽字符和 PUNCTUATION 中的标点"""
+    return frozenset(ZERO_WIDTH + PUNCTUATION)